@@ -1,27 +1,129 @@
 from datetime import datetime
-from models import Policy
+from sqlalchemy import and_, event, false, or_
+from decision_cache import DecisionCache
+from models import Resource
+from policy_engine import get_engine
+from telemetry import metrics
+from time_windows import FULL_DAY, format_minutes, in_window, minute_of_day, seconds_until_boundary
+
+# Кэш решений: запись живёт до ближайшей границы окна available_hours.
+# Размер и предельный срок задаёт init_decision_cache из конфига приложения
+decision_cache = DecisionCache()
+
+
+def init_decision_cache(app):
+    decision_cache.configure(app.config['DECISION_CACHE_SIZE'], app.config['DECISION_CACHE_MAX_TTL'])
+
+
+# Любое изменение ресурса через ORM сбрасывает его закэшированные решения в этом
+# процессе сразу; в остальных воркерах старые записи не находятся — атрибуты ресурса входят в ключ
+@event.listens_for(Resource, 'after_update')
+@event.listens_for(Resource, 'after_delete')
+def _invalidate_resource_decisions(mapper, connection, resource):
+    decision_cache.invalidate_resource(resource.id)
 
 # Проверка доступа пользователя к ресурсу по политикам из БД
-def check_access(user, resource, client_ip=None):
+def check_access(user, resource, client_ip=None, now=None):
+    """
+    Проверяет доступ пользователя к ресурсу.
+    now можно посчитать один раз на запрос и передавать для всех ресурсов
+    """
+    allowed, message, reason = cached_decision(user, resource, now or datetime.now())
+    metrics.record_decision(allowed, reason)
+    return allowed, message
+
+
+def cached_decision(user, resource, now):
+    # Версия движка — версия политик, на которой он собран (см. policy_engine.get_engine)
+    key = DecisionCache.make_key(user, resource, get_engine().version)
+    decision = decision_cache.get(key)
+    if decision is None:
+        decision = evaluate_access(user, resource, now)
+        decision_cache.put(key, decision, seconds_until_boundary(resource.window_start, resource.window_end, now))
+    return decision
+
+
+def check_access_many(pairs, users, resources, now=None):
+    """
+    Решения для пар (user_id, resource_id). users и resources — словари id -> объект.
+    Пары с одинаковыми атрибутами пользователя и ресурсом считаются один раз.
+    Возвращает список (разрешено, код причины)
+    """
+    now = now or datetime.now()
+    memo = {}
+    results = []
+    for user_id, resource_id in pairs:
+        user = users.get(user_id)
+        resource = resources.get(resource_id)
+        if user is None:
+            results.append((False, 'user_not_found'))
+            continue
+        if resource is None:
+            results.append((False, 'resource_not_found'))
+            continue
+        key = (user.subscription_level, user.account_status, resource_id)
+        decision = memo.get(key)
+        if decision is None:
+            allowed, _, reason = cached_decision(user, resource, now)
+            decision = memo[key] = (allowed, reason)
+        metrics.record_decision(*decision)
+        results.append(decision)
+    return results
+
+
+def evaluate_access(user, resource, now):
     """
-    Проверяет доступ пользователя к ресурсу
+    Возвращает (разрешено, сообщение, код причины) без кэша и метрик
     """
     # Статус аккаунта
     if user.account_status != 'active':
-        return False, 'Аккаунт не активен'
-    
+        return False, 'Аккаунт не активен', 'account_inactive'
+
     # Уровень подписки
     if resource.access_level == 'premium' and user.subscription_level != 'premium':
-        return False, 'Требуется premium подписка'
-    
-    # Проверка времени
-    if resource.available_hours != '00:00-23:59':
-        current_time = datetime.now().time()
-        start_str, end_str = resource.available_hours.split('-')
-        start = datetime.strptime(start_str, '%H:%M').time()
-        end = datetime.strptime(end_str, '%H:%M').time()
-        
-        if not (start <= current_time <= end):
-            return False, f'Ресурс доступен с {start_str} до {end_str}'
-    
-    return True, 'Доступ разрешён'
\ No newline at end of file
+        return False, 'Требуется premium подписка', 'subscription'
+
+    # Проверка времени по заранее разобранному окну
+    start, end = resource.window_start, resource.window_end
+    if (start, end) != FULL_DAY:
+        if not in_window(start, end, minute_of_day(now)):
+            return False, f'Ресурс доступен с {format_minutes(start)} до {format_minutes(end)}', 'time_window'
+
+    return evaluate_policies(user, resource)
+
+
+def evaluate_policies(user, resource):
+    allowed, rule_name = get_engine().evaluate(user, resource.id)
+    if not allowed:
+        return False, f'Нарушено правило: {rule_name}', 'policy'
+    return True, 'Доступ разрешён', 'allowed'
+
+
+# Политики из БД (глобальные и для конкретного ресурса)
+def check_policies(user, resource):
+    allowed, message, reason = evaluate_policies(user, resource)
+    metrics.record_decision(allowed, reason)
+    return allowed, message
+
+
+def access_filter(user, now=None):
+    """
+    Те же правила статуса, подписки и времени, что в check_access, но в виде
+    условия WHERE — недоступные ресурсы не покидают SQLite
+    """
+    if user.account_status != 'active':
+        return false()
+
+    minute = minute_of_day(now or datetime.now())
+    conditions = []
+    if user.subscription_level != 'premium':
+        conditions.append(or_(Resource.access_level != 'premium', Resource.access_level.is_(None)))
+
+    conditions.append(or_(
+        and_(Resource.window_start <= Resource.window_end,
+             Resource.window_start <= minute, Resource.window_end >= minute),
+        # Окно через полночь
+        and_(Resource.window_start > Resource.window_end,
+             or_(Resource.window_start <= minute, Resource.window_end >= minute)),
+    ))
+    return and_(*conditions)
@@ -0,0 +1,156 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import g, jsonify, request
+
+# Классы маршрутов с отдельными лимитами одновременных запросов
+HASHING_ENDPOINTS = ('main.api_login', 'main.api_register')
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class TokenBuckets:
+    """
+    Корзины токенов по ключу (IP, имя пользователя). Хранится только
+    (токены, время последнего обновления); корзины, которые успели
+    наполниться до краёв, периодически выметаются — они ничем не отличаются
+    от новых. Сверх max_keys за O(1) вытесняется давно не тронутая корзина
+    """
+
+    def __init__(self, rate, burst, max_keys=100000, sweep_interval=60.0, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        # Порядок — от давно не тронутых к недавним
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+
+    def take(self, key):
+        """
+        Забирает токен. Возвращает 0, если запрос пропущен, иначе — через
+        сколько секунд появится следующий токен
+        """
+        now = self._clock()
+        with self._lock:
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+            entry = self._buckets.get(key)
+            if entry is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+                entry = (self.burst, now)
+            else:
+                self._buckets.move_to_end(key)
+            tokens, updated = entry
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1, now)
+            return 0
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        refill_time = self.burst / self.rate
+        # Полные корзины — в начале порядка, дальше идут только более свежие
+        while self._buckets:
+            _, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < refill_time:
+                break
+            self._buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionControl:
+    """
+    Входной контроль: корзины токенов для входа и регистрации плюс
+    ограничение одновременных запросов по классам hashing/writes/reads.
+    Лишние запросы сразу получают 429, не занимая воркер
+    """
+
+    def __init__(self, concurrency, ip_rate, ip_burst, user_rate, user_burst,
+                 max_keys=100000, sweep_interval=60.0):
+        self.by_ip = TokenBuckets(ip_rate, ip_burst, max_keys, sweep_interval)
+        self.by_username = TokenBuckets(user_rate, user_burst, max_keys, sweep_interval)
+        self.limits = dict(concurrency)
+        self._slots = {name: threading.BoundedSemaphore(limit) for name, limit in self.limits.items()}
+        self._lock = threading.Lock()
+        self.rejected = {}
+
+    @staticmethod
+    def route_class(endpoint, method):
+        if endpoint in HASHING_ENDPOINTS:
+            return 'hashing'
+        return 'reads' if method in READ_METHODS else 'writes'
+
+    def acquire(self, route_class):
+        return self._slots[route_class].acquire(blocking=False)
+
+    def release(self, route_class):
+        self._slots[route_class].release()
+
+    def reject(self, reason, retry_after):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        response = jsonify({'success': False, 'message': 'Слишком много запросов, повторите попытку позже'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def stats(self):
+        with self._lock:
+            rejected = dict(self.rejected)
+        return {
+            'limits': self.limits,
+            'tracked_ips': len(self.by_ip),
+            'tracked_usernames': len(self.by_username),
+            'rejected': rejected,
+        }
+
+
+def init_admission(app):
+    if not app.config['ADMISSION_ENABLED']:
+        return
+    admission = app.extensions['admission'] = AdmissionControl(
+        app.config['ADMISSION_CONCURRENCY'],
+        ip_rate=app.config['ADMISSION_IP_RATE'],
+        ip_burst=app.config['ADMISSION_IP_BURST'],
+        user_rate=app.config['ADMISSION_USER_RATE'],
+        user_burst=app.config['ADMISSION_USER_BURST'],
+        max_keys=app.config['ADMISSION_MAX_KEYS'],
+        sweep_interval=app.config['ADMISSION_SWEEP_INTERVAL'],
+    )
+
+    @app.before_request
+    def _admit():
+        if request.endpoint in (None, 'static', 'assets'):
+            return None
+        route_class = admission.route_class(request.endpoint, request.method)
+
+        if route_class == 'hashing':
+            # Корзины проверяем до разбора пароля и до очереди в пул хэширования
+            wait = admission.by_ip.take(request.remote_addr or '')
+            if wait:
+                return admission.reject('ip', wait)
+            data = request.get_json(silent=True)
+            username = data.get('username') if isinstance(data, dict) else None
+            if isinstance(username, str) and username:
+                wait = admission.by_username.take(username.lower())
+                if wait:
+                    return admission.reject('username', wait)
+
+        if not admission.acquire(route_class):
+            return admission.reject(route_class, 1)
+        g.admission_slot = route_class
+        return None
+
+    @app.teardown_request
+    def _release(exc):
+        route_class = g.pop('admission_slot', None)
+        if route_class is not None:
+            admission.release(route_class)
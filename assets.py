@@ -0,0 +1,102 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен, есть gzip
+    brotli = None
+
+# Собираемые файлы из static/
+ASSET_FILES = ('script.js', 'style.css')
+MANIFEST_NAME = 'manifest.json'
+# Имя файла содержит хэш содержимого, поэтому его можно кэшировать навсегда
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def build_assets(static_dir, out_dir, gzip_level=9, brotli_quality=11):
+    """
+    Копирует ассеты под именами с хэшем содержимого (script.<хэш>.js),
+    рядом кладёт .gz и .br и пишет manifest.json: исходное имя -> собранное
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for name in ASSET_FILES:
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            data = f.read()
+        stem, ext = os.path.splitext(name)
+        built = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        variants = {built: data, f'{built}.gz': gzip.compress(data, compresslevel=gzip_level, mtime=0)}
+        if brotli is not None:
+            variants[f'{built}.br'] = brotli.compress(data, quality=brotli_quality)
+        for filename, content in variants.items():
+            with open(os.path.join(out_dir, filename), 'wb') as f:
+                f.write(content)
+        manifest[name] = built
+
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def assets_dir(app):
+    return app.config['ASSETS_DIR'] or os.path.join(app.static_folder, 'dist')
+
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(assets_dir(app), MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        # Сборки нет (разработка) — шаблоны ссылаются на исходные файлы
+        return {}
+
+
+def asset_url(name):
+    built = current_app.extensions['assets'].get(name)
+    if built is None:
+        return url_for('static', filename=name)
+    return url_for('assets', filename=built)
+
+
+def _choose_variant(directory, filename):
+    encodings = request.accept_encodings
+    if brotli is not None and encodings['br'] and os.path.exists(os.path.join(directory, f'{filename}.br')):
+        return f'{filename}.br', 'br'
+    if encodings['gzip'] and os.path.exists(os.path.join(directory, f'{filename}.gz')):
+        return f'{filename}.gz', 'gzip'
+    return filename, None
+
+
+def init_assets(app):
+    app.extensions['assets'] = load_manifest(app)
+    app.context_processor(lambda: {'asset_url': asset_url})
+
+    @app.route('/assets/<path:filename>')
+    def assets(filename):
+        directory = assets_dir(app)
+        variant, encoding = _choose_variant(directory, filename)
+        response = send_from_directory(directory, variant, mimetype=mimetypes.guess_type(filename)[0])
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+# СБОРКА АССЕТОВ: перед выкладкой, результат — в static/dist (ASSETS_DIR)
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    manifest = build_assets(
+        current_app.static_folder, assets_dir(current_app),
+        brotli_quality=current_app.config['ASSETS_BROTLI_QUALITY']
+    )
+    current_app.extensions['assets'] = manifest
+    for name, built in manifest.items():
+        click.echo(f'{name} -> {built}')
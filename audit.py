@@ -0,0 +1,152 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+from telemetry import logger
+
+
+class AuditLog:
+    """
+    Журнал решений о доступе с отложенной записью. record() только кладёт
+    кортеж в кольцевой буфер (deque, без блокировок), фоновый поток пачками
+    пишет записи в NDJSON-сегменты и переключает файл по размеру
+    """
+
+    def __init__(self, directory, capacity=65536, overflow='drop', block_timeout=0.1,
+                 flush_interval=1.0, batch_size=4096, segment_bytes=64 * 1024 * 1024, max_segments=100):
+        if overflow not in ('drop', 'block'):
+            raise ValueError(f'Неизвестная политика переполнения: {overflow}')
+        self.directory = directory
+        self.capacity = capacity
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.dropped = 0
+        self.written = 0
+        self._buffer = deque()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._segment = None
+        self._segment_size = 0
+
+    def record(self, user_id, resource_id, allowed, reason):
+        if len(self._buffer) >= self.capacity:
+            if not self._wait_for_space():
+                self.dropped += 1
+                return
+        self._buffer.append((time.time(), user_id, resource_id, bool(allowed), reason))
+        self._ensure_thread()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _wait_for_space(self):
+        if self.overflow == 'drop':
+            return False
+        self._wakeup.set()
+        deadline = time.monotonic() + self.block_timeout
+        while len(self._buffer) >= self.capacity:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def _ensure_thread(self):
+        # Поток запускается лениво и заново после fork: у дочернего процесса его нет
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._segment = None
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('audit_flush_failed')
+
+    def flush(self):
+        """
+        Сбрасывает всё накопленное в сегменты
+        """
+        with self._flush_lock:
+            while self._buffer:
+                lines = []
+                while self._buffer and len(lines) < self.batch_size:
+                    ts, user_id, resource_id, allowed, reason = self._buffer.popleft()
+                    lines.append(json.dumps({
+                        'ts': round(ts, 3), 'user_id': user_id, 'resource_id': resource_id,
+                        'allowed': allowed, 'reason': reason
+                    }, ensure_ascii=False))
+                self._write('\n'.join(lines) + '\n')
+                self.written += len(lines)
+
+    def _write(self, chunk):
+        data = chunk.encode('utf-8')
+        if self._segment is None or self._segment_size + len(data) > self.segment_bytes:
+            self._rotate()
+        with open(self._segment, 'ab') as f:
+            f.write(data)
+        self._segment_size += len(data)
+
+    def _rotate(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # Имя сортируется по времени; pid разводит файлы разных воркеров
+        name = f'audit-{time.time_ns():020d}-{os.getpid()}.ndjson'
+        self._segment = os.path.join(self.directory, name)
+        self._segment_size = 0
+        for old in self.segments()[:-self.max_segments]:
+            os.remove(old)
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, 'audit-*.ndjson')))
+
+    def iter_records(self, user_id=None, resource_id=None, allowed=None, since=None):
+        """
+        Построчно читает сегменты по порядку, не загружая их в память целиком
+        """
+        for path in self.segments():
+            try:
+                f = open(path, encoding='utf-8')
+            except FileNotFoundError:
+                # Сегмент удалили при ротации, пока мы читали предыдущие
+                continue
+            with f:
+                for line in f:
+                    entry = json.loads(line)
+                    if user_id is not None and entry['user_id'] != user_id:
+                        continue
+                    if resource_id is not None and entry['resource_id'] != resource_id:
+                        continue
+                    if allowed is not None and entry['allowed'] != allowed:
+                        continue
+                    if since is not None and entry['ts'] < since:
+                        continue
+                    yield line
+
+    def stats(self):
+        return {'buffered': len(self._buffer), 'written': self.written, 'dropped': self.dropped}
+
+
+def init_audit(app):
+    directory = app.config['AUDIT_DIR'] or os.path.join(app.instance_path, 'audit')
+    app.extensions['audit'] = AuditLog(
+        directory,
+        capacity=app.config['AUDIT_BUFFER_SIZE'],
+        overflow=app.config['AUDIT_OVERFLOW'],
+        block_timeout=app.config['AUDIT_BLOCK_TIMEOUT'],
+        flush_interval=app.config['AUDIT_FLUSH_INTERVAL'],
+        segment_bytes=app.config['AUDIT_SEGMENT_BYTES'],
+        max_segments=app.config['AUDIT_MAX_SEGMENTS'],
+    )
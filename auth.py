@@ -1,18 +1,125 @@
+import threading
+import time
+from flask import current_app, g
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
 from models import db, User
+from hashing import hash_password, verify_password, needs_rehash
+from profiling import phase
+import tokens
 
 login_manager = LoginManager()
-login_manager.login_view = 'login_page'
+login_manager.login_view = 'main.login_page'
+
+
+class CachedUser:
+    """
+    Лёгкая копия атрибутов пользователя для current_user вместо ORM-объекта
+    """
+    __slots__ = ('id', 'username', 'subscription_level', 'account_status')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username, subscription_level, account_status):
+        self.id = id
+        self.username = username
+        self.subscription_level = subscription_level
+        self.account_status = account_status
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.subscription_level, user.account_status)
+
+    def get_id(self):
+        return str(self.id)
+
+
+# Кэш пользователей процесса: user_id -> (CachedUser, время истечения)
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+
+def invalidate_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+
+
+# Смена статуса или подписки через ORM в этом процессе действует сразу.
+# Изменение в другом воркере или прямым SQL сюда не доходит: такой процесс
+# замечает его не позже чем через USER_CACHE_TTL (для токенов — AUTH_TOKEN_TTL)
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_cached_user(mapper, connection, user):
+    invalidate_user(user.id)
+    tokens.bump_version(user.id)
+
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    with phase('auth'):
+        return _load_user(int(user_id))
+
+
+def _load_user(user_id):
+    now = time.monotonic()
+    entry = _user_cache.get(user_id)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        invalidate_user(user_id)
+        return None
+
+    cached = CachedUser.from_user(user)
+    with _user_cache_lock:
+        if len(_user_cache) >= current_app.config['USER_CACHE_SIZE']:
+            # Выкидываем самую старую запись
+            _user_cache.pop(next(iter(_user_cache)))
+        _user_cache[user_id] = (cached, now + current_app.config['USER_CACHE_TTL'])
+    return cached
+
+
+def token_secret():
+    return current_app.config['AUTH_TOKEN_SECRET'] or current_app.config['SECRET_KEY']
+
+
+# Режим токенов: Authorization: Bearer <токен>, пользователь берётся из токена без БД
+@login_manager.request_loader
+def load_user_from_token(req):
+    if not current_app.config['AUTH_TOKEN_MODE']:
+        return None
+    scheme, _, token = req.headers.get('Authorization', '').partition(' ')
+    if scheme != 'Bearer' or not token:
+        return None
+    with phase('auth'):
+        payload = tokens.verify_token(token, token_secret())
+    if payload is None:
+        return None
+    g.auth_token = payload
+    return CachedUser(payload['uid'], payload['name'], payload['sub'], payload['st'])
+
+
+def issue_token(user):
+    return tokens.issue_token(user, token_secret(), current_app.config['AUTH_TOKEN_TTL'])
+
+
+def revoke_current_token():
+    payload = g.pop('auth_token', None)
+    if payload is not None:
+        tokens.revoke(payload)
 
 def register_user(username, password, subscription_level='basic', account_status='active'):
     if User.query.filter_by(username=username).first():
         return False, 'Пользователь уже существует'
-    hashed_password = generate_password_hash(password)
+    hashed_password = hash_password(password)
     new_user = User(
         username=username,
         password=hashed_password,
@@ -25,9 +132,13 @@ def register_user(username, password, subscription_level='basic', account_status
 
 def login_user_logic(username, password):
     user = User.query.filter_by(username=username).first()
-    if user and check_password_hash(user.password, password):
+    if user and verify_password(user.password, password):
         if user.account_status == 'frozen':
             return False, 'Аккаунт заморожен'
+        # Параметры хэширования поменялись — перехэшируем, пока знаем пароль
+        if needs_rehash(user.password):
+            user.password = hash_password(password)
+            db.session.commit()
         login_user(user)
         return True, 'Успешный вход'
     return False, 'Неверный логин или пароль'
\ No newline at end of file
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк API без сети: синтетические данные, Flask test client
+и локальный многопроцессный генератор нагрузки.
+
+    python benchmarks/bench_api.py --resources 10000 --users 1000 --output baseline.json
+    python benchmarks/bench_api.py --resources 10000 --compare baseline.json
+"""
+import argparse
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'bench'
+# Содержимое материала для сценариев /content: 1 МиБ, почти не сжимается, как PDF
+CONTENT_SIZE = 1024 * 1024
+
+_app = None
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, wall_time):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / wall_time, 1) if wall_time else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def setup_environment(db_path):
+    # Переменные окружения читаются при импорте config, поэтому ставим их до импорта app
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('HASH_POOL_WORKERS', '0')
+    os.environ['ACCESS_API_TOKEN'] = 'bench'
+    # Все логины генератора нагрузки идут с одного IP
+    os.environ.setdefault('ADMISSION_ENABLED', '0')
+    os.environ['AUDIT_DIR'] = os.path.join(os.path.dirname(db_path), 'audit')
+
+
+def seed(app, db, users, resources, policies):
+    """
+    Заполняет БД синтетикой: 10% premium-ресурсов, разные окна доступа,
+    политики на случайных ресурсах. Пароль у всех один — хэшируем один раз
+    """
+    import random
+    from sqlalchemy import insert
+    from models import User, Resource, Policy, upgrade_schema
+    from hashing import hash_password
+    from policy_engine import reload_policies
+    from time_windows import parse_window
+    from content import store_content
+
+    rng = random.Random(42)
+    windows = ['00:00-23:59'] * 6 + ['09:00-18:00', '08:00-22:00', '22:00-02:00', '06:00-12:00']
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        upgrade_schema()
+        pwhash = hash_password(PASSWORD)
+
+        rows = []
+        for i in range(users):
+            rows.append({
+                'username': f'user{i}',
+                'password': pwhash,
+                'subscription_level': 'premium' if i % 5 == 0 else 'basic',
+                'account_status': 'frozen' if i % 50 == 0 else 'active',
+            })
+        rows.append({'username': 'bench_admin', 'password': pwhash,
+                     'subscription_level': 'premium', 'account_status': 'active'})
+        db.session.execute(insert(User), rows)
+
+        for start in range(0, resources, 5000):
+            rows = []
+            for i in range(start, min(start + 5000, resources)):
+                hours = rng.choice(windows)
+                # У первого ресурса есть содержимое, он доступен круглые сутки
+                if i == 0:
+                    hours = '00:00-23:59'
+                window_start, window_end = parse_window(hours)
+                rows.append({
+                    'name': f'Курс {i}',
+                    'description': f'Описание курса {i} ' * 5,
+                    'access_level': 'premium' if i % 10 == 0 else 'basic',
+                    'available_hours': hours,
+                    'window_start': window_start,
+                    'window_end': window_end,
+                })
+            db.session.execute(insert(Resource), rows)
+
+        rows = []
+        for i in range(policies):
+            rows.append({
+                'name': f'Правило {i}',
+                'attribute': 'subscription_level',
+                'operator': 'in',
+                'value': 'basic,premium' if i % 2 else 'premium',
+                'resource_id': rng.randint(1, max(resources, 1)),
+            })
+        if rows:
+            db.session.execute(insert(Policy), rows)
+        db.session.commit()
+        if resources:
+            store_content(1, io.BytesIO(rng.randbytes(CONTENT_SIZE)), 'application/pdf',
+                          app.config['CONTENT_CHUNK_SIZE'])
+        reload_policies()
+
+
+def login(client, username):
+    response = client.post('/api/login', json={'username': username, 'password': PASSWORD})
+    assert response.get_json()['success'], response.get_data(as_text=True)
+
+
+def scenarios(resources):
+    """
+    Эндпоинт -> (функция запроса, от чьего имени). Каждая функция получает
+    клиента и номер итерации и возвращает ответ
+    """
+    resource_count = max(resources, 1)
+
+    def bulk_body(i):
+        return '\n'.join(
+            json.dumps({'name': f'Bulk {i}-{j}', 'available_hours': '09:00-18:00'}) for j in range(100)
+        )
+
+    def bulk_users_body(i):
+        # Каждый пароль — полноценный PBKDF2, поэтому пачка маленькая
+        return '\n'.join(
+            json.dumps({'username': f'bulk_{os.getpid()}_{i}_{j}', 'password': PASSWORD}) for j in range(2)
+        )
+
+    def bulk_policies_body(i):
+        return '\n'.join(json.dumps({
+            'name': f'Bulk {i}-{j}', 'attribute': 'account_status', 'operator': '==', 'value': 'active',
+            'resource_id': (i * 100 + j) % resource_count + 1}) for j in range(100)
+        )
+
+    content = os.urandom(256 * 1024)
+
+    result = {
+        'POST /api/register': (lambda c, i: c.post('/api/register', json={
+            'username': f'bench_new_{os.getpid()}_{i}', 'password': PASSWORD}), None),
+        'POST /api/login': (lambda c, i: c.post('/api/login', json={
+            'username': 'user1', 'password': PASSWORD}), None),
+        'GET /api/check': (lambda c, i: c.get('/api/check'), 'user1'),
+        'GET /api/resources': (lambda c, i: c.get('/api/resources'), 'user1'),
+        'GET /api/resources?format=ndjson': (lambda c, i: c.get('/api/resources?format=ndjson&limit=1000'), 'user1'),
+        'GET /api/resources/search': (lambda c, i: c.get(f'/api/resources/search?q=курс {i % resource_count}'), 'user1'),
+        'GET /api/resources/<id>': (lambda c, i: c.get(f'/api/resources/{i % resource_count + 1}'), 'user1'),
+        'POST /api/resources': (lambda c, i: c.post('/api/resources', json={
+            'name': f'Новый {i}', 'available_hours': '09:00-18:00'}), 'bench_admin'),
+        'POST /api/policies': (lambda c, i: c.post('/api/policies', json={
+            'name': f'Новое {i}', 'attribute': 'account_status', 'operator': '==', 'value': 'active',
+            'resource_id': i % resource_count + 1}), 'bench_admin'),
+        'POST /api/bulk/resources': (lambda c, i: c.post(
+            '/api/bulk/resources', data=bulk_body(i), content_type='application/x-ndjson'), 'bench_admin'),
+        'POST /api/bulk/users': (lambda c, i: c.post(
+            '/api/bulk/users', data=bulk_users_body(i), content_type='application/x-ndjson'), 'bench_admin'),
+        'POST /api/bulk/policies': (lambda c, i: c.post(
+            '/api/bulk/policies', data=bulk_policies_body(i), content_type='application/x-ndjson'), 'bench_admin'),
+        'PUT /api/resources/<id>/content': (lambda c, i: c.put(
+            f'/api/resources/{i % max(resource_count - 1, 1) + 2}/content', data=content,
+            content_type='application/octet-stream'), 'bench_admin'),
+        'GET /api/resources/<id>/content': (lambda c, i: c.get('/api/resources/1/content'), 'bench_admin'),
+        'GET /api/resources/<id>/content [Range]': (lambda c, i: c.get(
+            '/api/resources/1/content', headers={'Range': f'bytes={i * 4096 % CONTENT_SIZE}-{i * 4096 % CONTENT_SIZE + 65535}'}),
+            'bench_admin'),
+        'POST /api/access/batch': (lambda c, i: c.post('/api/access/batch', json={
+            'pairs': [[j % 100 + 1, (i * 1000 + j) % resource_count + 1] for j in range(1000)]},
+            headers={'Authorization': 'Bearer bench'}), None),
+        'GET /api/cache/stats': (lambda c, i: c.get('/api/cache/stats'), 'user1'),
+        'GET /api/audit': (lambda c, i: c.get('/api/audit?user_id=2&allowed=0'), 'bench_admin'),
+        'GET /api/metrics': (lambda c, i: c.get('/api/metrics'), 'bench_admin'),
+        'POST /api/logout': (lambda c, i: c.post('/api/logout'), 'user1'),
+    }
+    # Симуляция требует numpy; без него эндпоинт отвечает 501
+    if importlib.util.find_spec('numpy') is not None:
+        result['POST /api/policies/simulate'] = (lambda c, i: c.post('/api/policies/simulate', json={
+            'at': f'{i % 24:02d}:00',
+            'add': [{'attribute': 'subscription_level', 'operator': '==', 'value': 'premium',
+                     'resource_id': i % resource_count + 1}]}), 'bench_admin')
+    return result
+
+
+def run_endpoint(app, name, request_fn, username, iterations):
+    client = app.test_client()
+    latencies = []
+    for i in range(iterations):
+        # Выход разлогинивает клиента, поэтому перед каждым запросом входим заново
+        if username and (i == 0 or name == 'POST /api/logout'):
+            login(client, username)
+        t0 = time.perf_counter()
+        response = request_fn(client, i)
+        response.get_data()
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code >= 500:
+            raise RuntimeError(f'{name}: HTTP {response.status_code}')
+    # Запросы идут последовательно, время входа в пропускную способность не считаем
+    return summarize(latencies, sum(latencies))
+
+
+def _load_worker(args):
+    endpoint, username, iterations, resources, worker_id = args
+    from models import db
+    app = _app
+    # После fork соединения родителя использовать нельзя
+    with app.app_context():
+        db.engine.dispose()
+    request_fn, _ = scenarios(resources)[endpoint]
+    client = app.test_client()
+    if username:
+        login(client, username)
+    latencies = []
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        request_fn(client, worker_id * iterations + i).get_data()
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def run_load(endpoint, username, processes, iterations, resources):
+    """
+    Одновременная нагрузка из нескольких процессов на один эндпоинт
+    """
+    ctx = multiprocessing.get_context('fork')
+    jobs = [(endpoint, username, iterations, resources, w) for w in range(processes)]
+    started = time.perf_counter()
+    with ctx.Pool(processes) as pool:
+        results = pool.map(_load_worker, jobs)
+    wall_time = time.perf_counter() - started
+    return summarize([latency for worker in results for latency in worker], wall_time)
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    print(f'\nСравнение с {baseline_path} (порог {threshold:.0%}):')
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if previous[metric] and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(name)
+                print(f'  РЕГРЕССИЯ {name} {metric}: {previous[metric]} -> {current[metric]}')
+    if not regressions:
+        print('  регрессий нет')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк API')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--resources', type=int, default=10000)
+    parser.add_argument('--policies', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=200, help='запросов на эндпоинт')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--load-iterations', type=int, default=200, help='запросов на процесс в нагрузочном прогоне')
+    parser.add_argument('--output', help='сохранить результаты как JSON-базовую линию')
+    parser.add_argument('--compare', help='сравнить с сохранённой базовой линией')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимое ухудшение, доля')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='abac-bench-')
+    setup_environment(os.path.join(workdir, 'bench.db'))
+    global _app
+    from app import create_app
+    from models import db
+    # Процессы генератора нагрузки получают приложение через fork
+    app = _app = create_app()
+
+    print(f'Данные: {args.users} пользователей, {args.resources} ресурсов, {args.policies} политик')
+    seed(app, db, args.users, args.resources, args.policies)
+
+    results = {}
+    for name, (request_fn, username) in scenarios(args.resources).items():
+        results[name] = run_endpoint(app, name, request_fn, username, args.iterations)
+        print(f'{name:40} {results[name]}')
+
+    # Нагрузка из нескольких процессов на основные эндпоинты чтения
+    for name in ('GET /api/resources', 'GET /api/resources/<id>'):
+        key = f'{name} [load x{args.processes}]'
+        results[key] = run_load(name, 'user1', args.processes, args.load_iterations, args.resources)
+        print(f'{key:40} {results[key]}')
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'users': args.users,
+            'resources': args.resources,
+            'policies': args.policies,
+            'iterations': args.iterations,
+            'processes': args.processes,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'\nРезультаты сохранены в {args.output}')
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
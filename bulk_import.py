@@ -0,0 +1,233 @@
+import csv
+import json
+from flask import current_app
+from sqlalchemy import insert
+from models import db, User, Resource, Policy
+from content import split_description, insert_descriptions
+from policy_engine import validate_policy
+from time_windows import parse_window
+from hashing import hash_many
+
+# Сколько ошибок по строкам возвращать в ответе
+MAX_REPORTED_ERRORS = 1000
+
+
+# Текст ошибки для строки, которая не декодируется как UTF-8
+ENCODING_ERROR = 'Некорректная кодировка, ожидается UTF-8'
+
+
+def _decoded_lines(stream, bad_lines):
+    # Декодируем построчно: битая строка портит только себя, а не весь файл
+    for line_no, raw in enumerate(stream, start=1):
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError:
+            bad_lines.add(line_no)
+            yield raw.decode('utf-8', errors='replace')
+
+
+def iter_rows(stream, content_type):
+    """
+    Потоково читает тело запроса: NDJSON или CSV с заголовком.
+    Отдаёт (номер строки, dict) или (номер строки, текст ошибки)
+    """
+    bad_lines = set()
+    lines = _decoded_lines(stream, bad_lines)
+    if content_type == 'text/csv':
+        reader = csv.DictReader(lines)
+        # Номер строки файла с учётом заголовка; запись CSV может занимать несколько строк
+        last = 1
+        for row in reader:
+            first, last = last + 1, reader.line_num
+            if any(line_no in bad_lines for line_no in range(first, last + 1)):
+                yield first, ENCODING_ERROR
+            else:
+                yield first, row
+        return
+
+    for line_no, line in enumerate(lines, start=1):
+        if line_no in bad_lines:
+            yield line_no, ENCODING_ERROR
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_no, 'Некорректный JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_no, 'Строка должна быть JSON-объектом'
+            continue
+        yield line_no, row
+
+
+def _text(row, key, default=None):
+    """
+    Строковое поле строки импорта. В NDJSON значение может оказаться числом
+    или объектом — такую строку отклоняем, а не роняем запись всей пачки
+    """
+    value = row.get(key)
+    if value is None or value == '':
+        return default
+    if not isinstance(value, str):
+        raise ValueError(f'Поле {key} должно быть строкой')
+    return value
+
+
+def resource_row(row):
+    name = _text(row, 'name')
+    if not name:
+        raise ValueError('Не указано название')
+    available_hours = _text(row, 'available_hours', '09:00-18:00')
+    # Core-вставка обходит @validates модели, поэтому окно считаем здесь
+    window_start, window_end = parse_window(available_hours)
+    return {
+        'name': name,
+        'description': _text(row, 'description', ''),
+        'access_level': _text(row, 'access_level', 'basic'),
+        'available_hours': available_hours,
+        'window_start': window_start,
+        'window_end': window_end,
+    }
+
+
+def policy_row(row):
+    # Число в NDJSON допустимо: 5 и '5' — одно и то же значение
+    if isinstance(row.get('value'), (int, float)) and not isinstance(row['value'], bool):
+        row = {**row, 'value': str(row['value'])}
+    value = _text(row, 'value')
+    attribute, operator = _text(row, 'attribute'), _text(row, 'operator')
+    error = validate_policy(attribute, operator, value)
+    if error:
+        raise ValueError(error)
+    name = _text(row, 'name')
+    if not name:
+        raise ValueError('Не указано название')
+    resource_id = row.get('resource_id')
+    if isinstance(resource_id, bool) or not isinstance(resource_id, (int, str, type(None))):
+        raise ValueError('Поле resource_id должно быть числом')
+    return {
+        'name': name,
+        'attribute': attribute,
+        'operator': operator,
+        'value': value,
+        'resource_id': int(resource_id) if resource_id not in (None, '') else None,
+    }
+
+
+def user_row(row):
+    username, password = _text(row, 'username'), _text(row, 'password')
+    if not username or not password:
+        raise ValueError('Не указан логин или пароль')
+    return {
+        'username': username,
+        'password': password,
+        'subscription_level': _text(row, 'subscription_level', 'basic'),
+        'account_status': _text(row, 'account_status', 'active'),
+    }
+
+
+def _insert_resources(batch):
+    # Длинные описания уходят в resource_content, в resource — сводка
+    summary_length = current_app.config['DESCRIPTION_SUMMARY_LENGTH']
+    rows, bodies = [], []
+    for _, values in batch:
+        summary, body = split_description(values['description'], summary_length)
+        rows.append({**values, 'description': summary})
+        bodies.append(body)
+    ids = db.session.execute(
+        insert(Resource).returning(Resource.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    insert_descriptions(
+        db.session,
+        {resource_id: body for resource_id, body in zip(ids, bodies) if body is not None},
+        current_app.config['CONTENT_CHUNK_SIZE']
+    )
+    return [line_no for line_no, _ in batch], []
+
+
+def _insert_policies(batch):
+    db.session.execute(insert(Policy), [values for _, values in batch])
+    return [line_no for line_no, _ in batch], []
+
+
+def _insert_users(batch, seen_usernames):
+    errors = []
+    usernames = [values['username'] for _, values in batch]
+    existing = {
+        username for (username,) in
+        db.session.query(User.username).filter(User.username.in_(usernames))
+    }
+    fresh = []
+    for line_no, values in batch:
+        if values['username'] in existing or values['username'] in seen_usernames:
+            errors.append((line_no, 'Пользователь уже существует'))
+            continue
+        seen_usernames.add(values['username'])
+        fresh.append((line_no, values))
+    if not fresh:
+        return [], errors
+
+    # Пароли пачки хэшируются параллельно в пуле процессов
+    hashes = hash_many([values['password'] for _, values in fresh])
+    rows = [{**values, 'password': pwhash} for (_, values), pwhash in zip(fresh, hashes)]
+    db.session.execute(insert(User), rows)
+    return [line_no for line_no, _ in fresh], errors
+
+
+def run_import(rows, validate, insert_batch, batch_size):
+    """
+    Проверяет строки по мере чтения и вставляет их пачками,
+    каждая пачка — одна транзакция с executemany
+    """
+    report = {'inserted': 0, 'failed': 0, 'errors': []}
+
+    def add_error(line_no, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': line_no, 'error': message})
+
+    def flush(batch):
+        try:
+            inserted, errors = insert_batch(batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for line_no, _ in batch:
+                add_error(line_no, f'Ошибка записи пачки: {e.__class__.__name__}')
+            return
+        report['inserted'] += len(inserted)
+        for line_no, message in errors:
+            add_error(line_no, message)
+
+    batch = []
+    for line_no, row in rows:
+        if isinstance(row, str):
+            add_error(line_no, row)
+            continue
+        try:
+            batch.append((line_no, validate(row)))
+        except (ValueError, TypeError) as e:
+            add_error(line_no, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return report
+
+
+def import_resources(rows, batch_size):
+    return run_import(rows, resource_row, _insert_resources, batch_size)
+
+
+def import_policies(rows, batch_size):
+    return run_import(rows, policy_row, _insert_policies, batch_size)
+
+
+def import_users(rows, batch_size):
+    seen_usernames = set()
+    return run_import(rows, user_row, lambda batch: _insert_users(batch, seen_usernames), batch_size)
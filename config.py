@@ -2,5 +2,103 @@ import os
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'student_secret_key_123')
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///abac.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///abac.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Профиль SQLite: default — как раньше, production — WAL и пул read-only соединений
+    DB_PROFILE = os.getenv('DB_PROFILE', 'default')
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+    SQLITE_PROFILES = {
+        'default': {
+            'pragmas': {'busy_timeout': SQLITE_BUSY_TIMEOUT},
+        },
+        'production': {
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': SQLITE_BUSY_TIMEOUT,
+                'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+                # Отрицательное значение — размер кэша в КиБ
+                'cache_size': -int(os.getenv('SQLITE_CACHE_KB', 64 * 1024)),
+                'temp_store': 'MEMORY',
+            },
+            'read_pool_size': int(os.getenv('SQLITE_READ_POOL_SIZE', 8)),
+        },
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT / 1000}}
+    # Размер страницы для GET /api/resources
+    RESOURCES_PAGE_SIZE = int(os.getenv('RESOURCES_PAGE_SIZE', 100))
+    RESOURCES_MAX_PAGE_SIZE = int(os.getenv('RESOURCES_MAX_PAGE_SIZE', 1000))
+    # Как часто воркер сверяет версию политик, чтобы подхватить политики из других процессов, секунды
+    POLICY_VERSION_CHECK_INTERVAL = float(os.getenv('POLICY_VERSION_CHECK_INTERVAL', 1.0))
+    # Кэш решений о доступе
+    DECISION_CACHE_SIZE = int(os.getenv('DECISION_CACHE_SIZE', 10000))
+    DECISION_CACHE_MAX_TTL = int(os.getenv('DECISION_CACHE_MAX_TTL', 3600))
+    # Кэш пользователей в user_loader. Кэш у каждого воркера свой: заморозка или смена
+    # подписки, сделанная в другом процессе или прямым SQL, видна здесь не позже чем через TTL
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 30))
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    # Хэширование паролей в отдельном пуле процессов (0 — в потоке запроса)
+    HASH_POOL_WORKERS = int(os.getenv('HASH_POOL_WORKERS', 2))
+    HASH_QUEUE_SIZE = int(os.getenv('HASH_QUEUE_SIZE', 16))
+    HASH_TIMEOUT = int(os.getenv('HASH_TIMEOUT', 10))
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_SALT_LENGTH = int(os.getenv('PASSWORD_SALT_LENGTH', 16))
+    # Логирование: уровень и доля DEBUG-записей, которые попадают в лог
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.01))
+    # Размер пачки (одна транзакция) при массовой загрузке
+    BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 1000))
+    # Пакетная проверка доступа: сервисный токен и лимит пар в запросе
+    ACCESS_API_TOKEN = os.getenv('ACCESS_API_TOKEN', '')
+    ACCESS_BATCH_MAX_PAIRS = int(os.getenv('ACCESS_BATCH_MAX_PAIRS', 10000))
+    # Симуляция политик: сколько ресурсов обрабатывать за один блок
+    SIMULATION_CHUNK_SIZE = int(os.getenv('SIMULATION_CHUNK_SIZE', 2048))
+    # HTTP-кэширование и сжатие ответов
+    HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 30))
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_MIMETYPES = ('application/json', 'text/html', 'text/css', 'application/javascript')
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    # Журнал аудита решений о доступе (NDJSON-сегменты, по умолчанию instance/audit)
+    AUDIT_ENABLED = os.getenv('AUDIT_ENABLED', '1') == '1'
+    AUDIT_DIR = os.getenv('AUDIT_DIR')
+    AUDIT_BUFFER_SIZE = int(os.getenv('AUDIT_BUFFER_SIZE', 65536))
+    # drop — терять новые записи при переполнении, block — ждать до AUDIT_BLOCK_TIMEOUT секунд
+    AUDIT_OVERFLOW = os.getenv('AUDIT_OVERFLOW', 'drop')
+    AUDIT_BLOCK_TIMEOUT = float(os.getenv('AUDIT_BLOCK_TIMEOUT', 0.1))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1.0))
+    AUDIT_SEGMENT_BYTES = int(os.getenv('AUDIT_SEGMENT_BYTES', 64 * 1024 * 1024))
+    AUDIT_MAX_SEGMENTS = int(os.getenv('AUDIT_MAX_SEGMENTS', 100))
+    # Профилирование запросов: учёт SQL, Server-Timing, cProfile по выборке или заголовку X-Profile
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '0') == '1'
+    PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+    PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+    PROFILING_DIR = os.getenv('PROFILING_DIR')
+    PROFILING_NPLUS1_THRESHOLD = int(os.getenv('PROFILING_NPLUS1_THRESHOLD', 10))
+    # Входной контроль: корзины токенов для входа/регистрации (по IP и по имени)
+    # и лимиты одновременных запросов по классам маршрутов; сверх лимита — 429
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') == '1'
+    ADMISSION_IP_RATE = float(os.getenv('ADMISSION_IP_RATE', 1.0))
+    ADMISSION_IP_BURST = int(os.getenv('ADMISSION_IP_BURST', 20))
+    ADMISSION_USER_RATE = float(os.getenv('ADMISSION_USER_RATE', 0.2))
+    ADMISSION_USER_BURST = int(os.getenv('ADMISSION_USER_BURST', 5))
+    ADMISSION_CONCURRENCY = {
+        'hashing': int(os.getenv('ADMISSION_HASHING_CONCURRENCY', 8)),
+        'writes': int(os.getenv('ADMISSION_WRITES_CONCURRENCY', 16)),
+        'reads': int(os.getenv('ADMISSION_READS_CONCURRENCY', 256)),
+    }
+    ADMISSION_MAX_KEYS = int(os.getenv('ADMISSION_MAX_KEYS', 100000))
+    ADMISSION_SWEEP_INTERVAL = float(os.getenv('ADMISSION_SWEEP_INTERVAL', 60))
+    # Режим токенов: вход дополнительно выдаёт короткоживущий подписанный токен
+    # с ABAC-атрибутами; запросы с Authorization: Bearer проверяются без БД
+    AUTH_TOKEN_MODE = os.getenv('AUTH_TOKEN_MODE', '0') == '1'
+    AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', 300))
+    AUTH_TOKEN_SECRET = os.getenv('AUTH_TOKEN_SECRET', '')
+    # Содержимое материалов: размер блока до сжатия (каждый блок сжимается отдельно)
+    CONTENT_CHUNK_SIZE = int(os.getenv('CONTENT_CHUNK_SIZE', 64 * 1024))
+    # Длина сводки описания в строке resource; длинное описание целиком — в содержимом материала
+    DESCRIPTION_SUMMARY_LENGTH = int(os.getenv('DESCRIPTION_SUMMARY_LENGTH', 280))
+    # Собранные ассеты с хэшем в имени (flask build-assets), по умолчанию static/dist
+    ASSETS_DIR = os.getenv('ASSETS_DIR')
+    ASSETS_BROTLI_QUALITY = int(os.getenv('ASSETS_BROTLI_QUALITY', 11))
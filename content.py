@@ -0,0 +1,152 @@
+import hashlib
+import zlib
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, insert, select, text
+from models import db, ResourceContent, ResourceContentChunk
+from telemetry import logger
+
+# Полное описание материала хранится как его содержимое
+DESCRIPTION_MIMETYPE = 'text/plain; charset=utf-8'
+
+
+def store_content(resource_id, stream, mimetype, chunk_size, level=6):
+    """
+    Читает поток порциями по chunk_size байт и сохраняет каждую порцию
+    сжатой отдельной строкой. Весь файл в памяти не держится
+    """
+    db.session.execute(delete(ResourceContentChunk).where(ResourceContentChunk.resource_id == resource_id))
+    content = db.session.get(ResourceContent, resource_id)
+    if content is None:
+        content = ResourceContent(resource_id=resource_id)
+        db.session.add(content)
+    content.mimetype = mimetype or 'application/octet-stream'
+    content.chunk_size = chunk_size
+    content.size, content.digest = 0, ''
+    # Строка-родитель нужна до вставки блоков (внешний ключ)
+    db.session.flush()
+
+    digest = hashlib.sha1()
+    size = 0
+    for seq, data in enumerate(_blocks(stream, chunk_size)):
+        digest.update(data)
+        size += len(data)
+        db.session.execute(insert(ResourceContentChunk).values(
+            resource_id=resource_id, seq=seq, data=zlib.compress(data, level)
+        ))
+
+    content.size = size
+    content.digest = digest.hexdigest()
+    content.updated_at = datetime.utcnow()
+    db.session.commit()
+    return content
+
+
+def _blocks(stream, chunk_size):
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            return
+        # Поток может отдать меньше, чем просили: добираем до полного блока
+        while len(data) < chunk_size:
+            more = stream.read(chunk_size - len(data))
+            if not more:
+                break
+            data += more
+        yield data
+
+
+def split_description(description, summary_length):
+    """
+    Короткая сводка для строки resource и полный текст для resource_content.
+    Если описание помещается в сводку целиком, полный текст не нужен (None)
+    """
+    description = description or ''
+    if len(description) <= summary_length:
+        return description, None
+    return description[:summary_length - 1].rstrip() + '…', description
+
+
+def _description_rows(resource_id, body, chunk_size, level=6):
+    """
+    Строки resource_content и resource_content_chunk для полного описания —
+    для вставки через Core вместе с самим ресурсом
+    """
+    data = body.encode('utf-8')
+    chunks = [
+        {'resource_id': resource_id, 'seq': seq, 'data': zlib.compress(data[offset:offset + chunk_size], level)}
+        for seq, offset in enumerate(range(0, len(data), chunk_size))
+    ]
+    content = {
+        'resource_id': resource_id,
+        'mimetype': DESCRIPTION_MIMETYPE,
+        'size': len(data),
+        'chunk_size': chunk_size,
+        'digest': hashlib.sha1(data).hexdigest(),
+        'updated_at': datetime.utcnow(),
+    }
+    return content, chunks
+
+
+def insert_descriptions(connection, bodies, chunk_size):
+    """
+    Сохраняет полные описания {resource_id: текст} сжатыми блоками
+    """
+    contents, chunks = [], []
+    for resource_id, body in bodies.items():
+        content, rows = _description_rows(resource_id, body, chunk_size)
+        contents.append(content)
+        chunks.extend(rows)
+    if contents:
+        connection.execute(insert(ResourceContent), contents)
+        connection.execute(insert(ResourceContentChunk), chunks)
+
+
+def move_long_descriptions(conn):
+    """
+    Однократная миграция: длинные описания из resource переезжают в
+    resource_content, в resource остаётся сводка
+    """
+    summary_length = current_app.config['DESCRIPTION_SUMMARY_LENGTH']
+    chunk_size = current_app.config['CONTENT_CHUNK_SIZE']
+    rows = conn.execute(text(
+        'SELECT r.id, r.description, c.resource_id IS NOT NULL FROM resource r'
+        ' LEFT JOIN resource_content c ON c.resource_id = r.id'
+        ' WHERE length(r.description) > :length'
+    ), {'length': summary_length}).fetchall()
+    moved, kept = 0, []
+    for resource_id, description, has_content in rows:
+        if has_content:
+            # Уже загружен файл — не затираем его, описание остаётся в строке
+            kept.append(resource_id)
+            continue
+        summary, body = split_description(description, summary_length)
+        insert_descriptions(conn, {resource_id: body}, chunk_size)
+        conn.execute(text('UPDATE resource SET description = :summary WHERE id = :id'),
+                     {'summary': summary, 'id': resource_id})
+        moved += 1
+    if kept:
+        logger.warning('descriptions_kept', extra={'fields': {'resource_ids': kept}})
+    logger.info('descriptions_moved', extra={'fields': {'count': moved}})
+
+
+def iter_content(content, start, stop, batch_size=16):
+    """
+    Байты [start, stop) содержимого: читаются и распаковываются только
+    блоки, которые пересекаются с диапазоном
+    """
+    if start >= stop:
+        return
+    chunk_size = content.chunk_size
+    first, last = start // chunk_size, (stop - 1) // chunk_size
+    rows = db.session.execute(
+        select(ResourceContentChunk.seq, ResourceContentChunk.data)
+        .where(ResourceContentChunk.resource_id == content.resource_id)
+        .where(ResourceContentChunk.seq.between(first, last))
+        .order_by(ResourceContentChunk.seq)
+        .execution_options(yield_per=batch_size)
+    )
+    for seq, data in rows:
+        data = zlib.decompress(data)
+        offset = seq * chunk_size
+        yield data[max(start - offset, 0):stop - offset]
@@ -0,0 +1,72 @@
+from flask import current_app, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+
+
+class RoutingSession(Session):
+    """
+    Сессия, которая в read-only запросах отправляет SELECT в отдельный
+    пул соединений только для чтения, а запись — в основной движок
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('read_only') and not self._flushing and has_app_context():
+            read_engine = current_app.extensions.get('abac_read_engine')
+            if read_engine is not None:
+                return read_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return set_pragmas
+
+
+def _is_file_database(engine):
+    return engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:')
+
+
+def init_database(app, db):
+    """
+    Применяет профиль SQLite из конфига: PRAGMA на каждом новом соединении
+    и, если профиль требует, пул read-only соединений для GET-запросов
+    """
+    profile = app.config['SQLITE_PROFILES'][app.config['DB_PROFILE']]
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    if profile.get('pragmas'):
+        event.listen(engine, 'connect', _pragma_listener(profile['pragmas']))
+
+    if not profile.get('read_pool_size') or not _is_file_database(engine):
+        return
+
+    read_engine = create_engine(
+        f'sqlite:///file:{engine.url.database}?mode=ro&uri=true',
+        pool_size=profile['read_pool_size'],
+        max_overflow=profile['read_pool_size'],
+        connect_args={'timeout': app.config['SQLITE_BUSY_TIMEOUT'] / 1000, 'check_same_thread': False},
+    )
+    read_pragmas = {
+        name: value for name, value in profile.get('pragmas', {}).items()
+        if name not in ('journal_mode', 'synchronous')
+    }
+    read_pragmas['query_only'] = 'ON'
+    event.listen(read_engine, 'connect', _pragma_listener(read_pragmas))
+    app.extensions['abac_read_engine'] = read_engine
+
+    @app.before_request
+    def _route_reads():
+        # Только GET/HEAD читают из пула read-only; сессия общая на контекст, поэтому флаг ставим всегда
+        db.session.info['read_only'] = request.method in ('GET', 'HEAD')
+
+    @app.teardown_request
+    def _reset_routing(exc):
+        if has_app_context():
+            db.session.info.pop('read_only', None)
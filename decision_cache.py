@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class DecisionCache:
+    """
+    LRU-кэш решений о доступе с индивидуальным временем жизни записи.
+    Ключ не содержит id пользователя, поэтому одно решение делят все
+    пользователи с одинаковыми атрибутами. В ключе — всё, от чего зависит
+    решение: атрибуты ресурса и общая для всех процессов версия политик.
+    Запись других ресурсов или их содержимого ключ не меняет
+    """
+
+    # Позиция resource_id в ключе (для сброса записей одного ресурса)
+    RESOURCE_ID = 5
+
+    def __init__(self, maxsize=10000, max_ttl=3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        # resource_id -> ключи, чтобы сбрасывать записи одного ресурса
+        self._by_resource = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def configure(self, maxsize, max_ttl):
+        # Настройки из конфига приложения; сам объект остаётся прежним,
+        # его импортируют по имени
+        with self._lock:
+            self.maxsize = maxsize
+            self.max_ttl = max_ttl
+            self._data.clear()
+            self._by_resource.clear()
+
+    @staticmethod
+    def make_key(user, resource, policy_version):
+        return (
+            user.subscription_level, user.account_status,
+            resource.access_level, resource.window_start, resource.window_end,
+            resource.id, policy_version,
+        )
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        if ttl is None or ttl > self.max_ttl:
+            ttl = self.max_ttl
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (value, self._clock() + ttl)
+            self._by_resource.setdefault(key[self.RESOURCE_ID], set()).add(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_resource(self, resource_id):
+        with self._lock:
+            for key in self._by_resource.pop(resource_id, ()):
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_resource.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _remove(self, key):
+        del self._data[key]
+        keys = self._by_resource.get(key[self.RESOURCE_ID])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_resource[key[self.RESOURCE_ID]]
+
+    def __len__(self):
+        return len(self._data)
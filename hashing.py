@@ -0,0 +1,100 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """
+    Очередь на хэширование паролей заполнена
+    """
+
+
+_executor = None
+_slots = None
+_workers = 0
+_init_lock = threading.Lock()
+
+
+def _get_pool():
+    global _executor, _slots, _workers
+    if _slots is None:
+        with _init_lock:
+            if _slots is None:
+                workers = _workers = current_app.config['HASH_POOL_WORKERS']
+                if workers > 0:
+                    # spawn: дочерним процессам не достаются потоки и соединения с БД
+                    _executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                # Выполняемые задачи плюс ограниченная очередь ожидающих
+                _slots = threading.BoundedSemaphore(max(workers, 1) + current_app.config['HASH_QUEUE_SIZE'])
+    return _executor, _slots
+
+
+def _run(fn, *args):
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    if executor is None:
+        try:
+            return fn(*args)
+        finally:
+            slots.release()
+
+    future = executor.submit(fn, *args)
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=current_app.config['HASH_TIMEOUT'])
+    except FutureTimeoutError:
+        # Ещё не начатую задачу снимаем; слот освободится, когда она завершится
+        future.cancel()
+        raise HashingBusy()
+
+
+def hash_password(password):
+    return _run(
+        generate_password_hash, password,
+        current_app.config['PASSWORD_HASH_METHOD'],
+        current_app.config['PASSWORD_SALT_LENGTH']
+    )
+
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+
+def hash_many(passwords):
+    """
+    Хэширует пачку паролей параллельно на всех процессах пула.
+    Каждая задача занимает слот, как и одиночные, и в пуле одновременно не
+    больше задач пачки, чем процессов — входы и регистрации не ждут всю пачку
+    """
+    executor, slots = _get_pool()
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    salt_length = current_app.config['PASSWORD_SALT_LENGTH']
+    if executor is None:
+        return [generate_password_hash(p, method, salt_length) for p in passwords]
+
+    timeout = current_app.config['HASH_TIMEOUT']
+    in_flight = deque()
+    hashes = []
+    for password in passwords:
+        if len(in_flight) >= _workers:
+            hashes.append(in_flight.popleft().result(timeout=timeout))
+        # Пачка может подождать свободного слота, в отличие от интерактивного входа
+        if not slots.acquire(timeout=timeout):
+            raise HashingBusy()
+        future = executor.submit(generate_password_hash, password, method, salt_length)
+        future.add_done_callback(lambda _: slots.release())
+        in_flight.append(future)
+    hashes.extend(future.result(timeout=timeout) for future in in_flight)
+    return hashes
+
+
+def needs_rehash(pwhash):
+    # Параметры хэша хранятся в префиксе: 'pbkdf2:sha256:600000$соль$хэш'
+    return pwhash.split('$', 1)[0] != current_app.config['PASSWORD_HASH_METHOD']
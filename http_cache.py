@@ -0,0 +1,151 @@
+import functools
+import gzip
+import hashlib
+from datetime import datetime
+from flask import current_app, request, make_response
+from flask_login import current_user
+from sqlalchemy import select
+from models import db, Resource, catalog_version
+from time_windows import MINUTES_PER_DAY, minute_of_day
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен, есть gzip
+    brotli = None
+
+# Суффиксы ETag для сжатых представлений: у каждого кодирования свой строгий ETag
+ENCODING_SUFFIXES = ('-br', '-gzip')
+
+# (версия каталога, границы) — заменяется целиком одним присваиванием
+_boundaries = (None, ())
+
+
+def window_boundaries(version):
+    """
+    Все минуты суток, в которые у какого-то ресурса открывается или закрывается окно.
+    Считаются один раз на версию каталога
+    """
+    global _boundaries
+    cached_version, cached_minutes = _boundaries
+    if cached_version == version:
+        return cached_minutes
+    rows = db.session.execute(select(Resource.window_start, Resource.window_end).distinct()).all()
+    minutes = set()
+    for start, end in rows:
+        if start is None or (start, end) == (0, MINUTES_PER_DAY - 1):
+            continue
+        minutes.add(start)
+        minutes.add((end + 1) % MINUTES_PER_DAY)
+    minutes = tuple(sorted(minutes))
+    _boundaries = (version, minutes)
+    return minutes
+
+
+def time_slot(boundaries, now):
+    """
+    Номер промежутка между границами окон, в котором находится now,
+    и сколько секунд до следующей границы (None, если границ нет)
+    """
+    if not boundaries:
+        return 0, None
+    minute = minute_of_day(now)
+    slot = sum(1 for boundary in boundaries if boundary <= minute)
+    next_boundary = boundaries[slot] if slot < len(boundaries) else boundaries[0] + MINUTES_PER_DAY
+    seconds = next_boundary * 60 - (minute * 60 + now.second)
+    return slot % len(boundaries), seconds
+
+
+def _matches(if_none_match, etag):
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        tag = tag.strip('"')
+        for suffix in ENCODING_SUFFIXES:
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)]
+                break
+        if tag == etag:
+            return True
+    return False
+
+
+def wants_ndjson():
+    # Формат ответа списка: явный format=ndjson или Accept
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def conditional_get(view):
+    """
+    Строгий ETag из версии каталога, класса атрибутов пользователя, текущего
+    временного промежутка, параметров запроса и выбранного формата. Совпадение с If-None-Match —
+    сразу 304, без проверки доступа и сериализации
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        now = datetime.now()
+        version = catalog_version()
+        slot, seconds_left = time_slot(window_boundaries(version), now)
+        key = '|'.join(map(str, (
+            request.path, request.query_string.decode('latin-1'), version,
+            current_user.subscription_level, current_user.account_status, slot,
+            'ndjson' if wants_ndjson() else 'json'
+        )))
+        etag = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+        max_age = current_app.config['HTTP_CACHE_MAX_AGE']
+        if seconds_left is not None:
+            max_age = min(max_age, seconds_left)
+        cache_control = f'private, max-age={max_age}'
+
+        if _matches(request.headers.get('If-None-Match', ''), etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Cookie')
+        response.vary.add('Authorization')
+        response.vary.add('Accept')
+        return response
+    return wrapper
+
+
+def _choose_encoding(accept_encoding):
+    if brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def init_compression(app):
+    """
+    Сжимает большие ответы по Accept-Encoding: brotli, если установлен, иначе gzip
+    """
+    @app.after_request
+    def _compress(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in app.config['COMPRESS_MIMETYPES']):
+            return response
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        encoding = _choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if encoding == 'br':
+            compressed = brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+        else:
+            compressed = gzip.compress(data, compresslevel=app.config['COMPRESS_GZIP_LEVEL'])
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        return response
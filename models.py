@@ -1,8 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import validates
 from datetime import datetime
+from time_windows import parse_window
+from database import RoutingSession
+from telemetry import logger
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Пользователь
 class User(UserMixin, db.Model):
@@ -15,13 +20,44 @@ class User(UserMixin, db.Model):
 
 # Ресурс (обучающий материал)
 class Resource(db.Model):
+    __table_args__ = (
+        db.Index('ix_resource_window', 'window_start', 'window_end'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
+    # Короткая сводка (DESCRIPTION_SUMMARY_LENGTH символов); полный текст длинного
+    # описания — сжатым в resource_content, отдаётся через /content
     description = db.Column(db.Text, default='')
-    access_level = db.Column(db.String(20), default='basic')
+    access_level = db.Column(db.String(20), default='basic', index=True)
     available_hours = db.Column(db.String(50), default='09:00-18:00')
+    # Окно доступа в минутах от начала суток, считается из available_hours
+    window_start = db.Column(db.Integer, default=9 * 60)
+    window_end = db.Column(db.Integer, default=18 * 60)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    @validates('available_hours')
+    def validate_available_hours(self, key, value):
+        # Разбираем окно один раз при записи, а не при каждой проверке доступа
+        self.window_start, self.window_end = parse_window(value)
+        return value
+
+# Содержимое материала: вынесено из resource, хранится сжатыми блоками.
+# Каждый блок сжат отдельно, поэтому диапазон байт читается без распаковки всего файла
+class ResourceContent(db.Model):
+    resource_id = db.Column(db.Integer, db.ForeignKey('resource.id', ondelete='CASCADE'), primary_key=True)
+    mimetype = db.Column(db.String(100), nullable=False, default='application/octet-stream')
+    size = db.Column(db.Integer, nullable=False, default=0)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    digest = db.Column(db.String(40), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ResourceContentChunk(db.Model):
+    resource_id = db.Column(db.Integer, db.ForeignKey('resource_content.resource_id', ondelete='CASCADE'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+
 # Политика доступа (ABAC правило)
 class Policy(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,4 +66,207 @@ class Policy(db.Model):
     operator = db.Column(db.String(10), nullable=False)
     value = db.Column(db.String(100), nullable=False)
     resource_id = db.Column(db.Integer, db.ForeignKey('resource.id'), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Версия каталога: растёт при любом изменении ресурсов, их содержимого и политик (см. триггеры ниже).
+# Версия политик — только при изменении политик: по ней воркеры пересобирают движок
+class CatalogState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    policy_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+# Однократные миграции данных: имя записывается после успешного применения
+class SchemaMigration(db.Model):
+    name = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def catalog_version():
+    return db.session.execute(select(CatalogState.version).where(CatalogState.id == 1)).scalar() or 0
+
+
+def policy_version():
+    return db.session.execute(select(CatalogState.policy_version).where(CatalogState.id == 1)).scalar() or 0
+
+
+# Триггеры увеличивают версию в той же транзакции, что и запись,
+# поэтому её видят все процессы, включая массовую загрузку
+CATALOG_VERSION_DDL = [
+    "INSERT OR IGNORE INTO catalog_state (id, version) VALUES (1, 0)",
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_version_{table}_{suffix} AFTER {action} ON {table} BEGIN
+        UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+    END"""
+    for table in ('resource', 'policy', 'resource_content')
+    for suffix, action in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE'))
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS policy_version_{suffix} AFTER {action} ON policy BEGIN
+        UPDATE catalog_state SET policy_version = policy_version + 1 WHERE id = 1;
+    END"""
+    for suffix, action in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE'))
+]
+
+
+def create_catalog_version_triggers(connection):
+    for statement in CATALOG_VERSION_DDL:
+        connection.execute(text(statement))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_catalog_version_triggers(metadata, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        create_catalog_version_triggers(connection)
+
+
+# Полнотекстовый индекс FTS5 по названию и описанию ресурса.
+# Внешний контент: тексты хранятся только в resource, синхронизацию делают триггеры
+SEARCH_INDEX_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS resource_fts USING fts5(
+        name, description, content='resource', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS resource_fts_ai AFTER INSERT ON resource BEGIN
+        INSERT INTO resource_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS resource_fts_ad AFTER DELETE ON resource BEGIN
+        INSERT INTO resource_fts(resource_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS resource_fts_au AFTER UPDATE OF name, description ON resource BEGIN
+        INSERT INTO resource_fts(resource_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO resource_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+)
+
+
+def create_search_index(connection):
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+
+
+@event.listens_for(Resource.__table__, 'after_create')
+def _create_search_index(table, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        create_search_index(connection)
+
+
+@event.listens_for(Resource.__table__, 'before_drop')
+def _drop_search_index(table, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text('DROP TABLE IF EXISTS resource_fts'))
+
+
+# Досоздание новых колонок в уже существующей БД
+def upgrade_schema():
+    columns = {column['name'] for column in inspect(db.engine).get_columns('resource')}
+    if 'window_start' not in columns or 'window_end' not in columns:
+        _backfill_windows(columns)
+
+    # Индексы для фильтрации доступа в SQL
+    for index in Resource.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+    if db.engine.dialect.name == 'sqlite':
+        state_columns = {column['name'] for column in inspect(db.engine).get_columns('catalog_state')}
+        with db.engine.begin() as conn:
+            if 'policy_version' not in state_columns:
+                conn.execute(text('ALTER TABLE catalog_state ADD COLUMN policy_version INTEGER NOT NULL DEFAULT 0'))
+            # Триггеры версии политик появились позже, чем таблица
+            create_catalog_version_triggers(conn)
+
+        with db.engine.begin() as conn:
+            existing = {row[0] for row in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE name LIKE 'resource_fts%'"
+            ))}
+            if not {'resource_fts', 'resource_fts_ai', 'resource_fts_ad', 'resource_fts_au'} <= existing:
+                create_search_index(conn)
+                # Индекс появился у БД с данными — заполняем его из resource
+                conn.execute(text("INSERT INTO resource_fts(resource_fts) VALUES ('rebuild')"))
+
+    run_migration_once('rescope_legacy_premium_policy', _rescope_legacy_premium_policy)
+
+    from content import move_long_descriptions
+    run_migration_once('move_long_descriptions', move_long_descriptions)
+
+
+def run_migration_once(name, migrate):
+    """
+    Применяет миграцию данных migrate(conn), если она ещё не записана
+    в schema_migration. Миграция и отметка — в одной транзакции
+    """
+    with db.engine.begin() as conn:
+        applied = conn.execute(
+            select(SchemaMigration.name).where(SchemaMigration.name == name)
+        ).scalar()
+        if applied is not None:
+            return False
+        migrate(conn)
+        conn.execute(SchemaMigration.__table__.insert().values(name=name, applied_at=datetime.utcnow()))
+    return True
+
+
+def _rescope_legacy_premium_policy(conn):
+    # Старый seed записал «Премиум доступ» глобальным правилом — движок политик
+    # применяет его ко всем ресурсам и закрывает basic-пользователям весь каталог.
+    # Привязываем его к premium-ресурсу, как в нынешнем seed. Выполняется один раз:
+    # такое же правило, созданное администратором позже, не трогаем
+    legacy = (
+        "name = 'Премиум доступ' AND attribute = 'subscription_level' AND operator = '=='"
+        " AND value = 'premium' AND resource_id IS NULL"
+    )
+    policy_ids = [row[0] for row in conn.execute(text(f'SELECT id FROM policy WHERE {legacy}'))]
+    if not policy_ids:
+        return
+    premium_id = conn.execute(text(
+        "SELECT id FROM resource WHERE access_level = 'premium' ORDER BY id LIMIT 1"
+    )).scalar()
+    if premium_id is None:
+        # Привязать не к чему: оставляем правило как есть, решение — за администратором
+        logger.warning('legacy_policy_kept', extra={'fields': {'policy_ids': policy_ids}})
+        return
+    conn.execute(text(f'UPDATE policy SET resource_id = :id WHERE {legacy}'), {'id': premium_id})
+    logger.info('legacy_policy_rescoped', extra={'fields': {'policy_ids': policy_ids, 'resource_id': premium_id}})
+
+
+def _backfill_windows(columns):
+    with db.engine.begin() as conn:
+        if 'window_start' not in columns:
+            conn.execute(text('ALTER TABLE resource ADD COLUMN window_start INTEGER'))
+        if 'window_end' not in columns:
+            conn.execute(text('ALTER TABLE resource ADD COLUMN window_end INTEGER'))
+
+        rows = conn.execute(text('SELECT id, available_hours FROM resource')).fetchall()
+        for resource_id, available_hours in rows:
+            try:
+                start, end = parse_window(available_hours or '09:00-18:00')
+            except ValueError:
+                # Старые некорректные данные: берём окно по умолчанию
+                start, end = parse_window('09:00-18:00')
+            conn.execute(
+                text('UPDATE resource SET window_start = :start, window_end = :end WHERE id = :id'),
+                {'start': start, 'end': end, 'id': resource_id}
+            )
+
+
+# Демонстрационные данные для пустой БД (команда flask init-db)
+def seed_demo_data():
+    if Resource.query.count() == 0:
+        test_resources = [
+            Resource(name='Python Basics', description='Основы Python', access_level='basic', available_hours='09:00-18:00'),
+            Resource(name='Flask Advanced', description='Продвинутый Flask', access_level='premium', available_hours='00:00-23:59'),
+            Resource(name='SQL Database', description='База данных', access_level='basic', available_hours='09:00-20:00'),
+        ]
+        db.session.add_all(test_resources)
+        db.session.commit()
+
+    if Policy.query.count() == 0:
+        premium_resource = Resource.query.filter_by(access_level='premium').first()
+        policies = [
+            Policy(name='Премиум доступ', attribute='subscription_level', operator='==', value='premium',
+                   resource_id=premium_resource.id if premium_resource else None),
+            Policy(name='Активный аккаунт', attribute='account_status', operator='==', value='active', resource_id=None),
+        ]
+        db.session.add_all(policies)
+        db.session.commit()
@@ -0,0 +1,145 @@
+import operator
+import threading
+import time
+
+from flask import current_app
+from models import Policy, policy_version
+from telemetry import logger
+
+# Атрибуты пользователя, по которым можно писать политики
+USER_ATTRIBUTES = ('subscription_level', 'account_status')
+
+
+def _split_values(value):
+    return frozenset(v.strip() for v in value.split(',') if v.strip())
+
+
+# Оператор -> (подготовка значения, функция сравнения)
+OPERATORS = {
+    '==': (str, operator.eq),
+    '!=': (str, operator.ne),
+    'in': (_split_values, lambda actual, expected: actual in expected),
+    'not in': (_split_values, lambda actual, expected: actual not in expected),
+}
+
+
+class CompiledRule:
+    """
+    Скомпилированное правило: предикат над атрибутами пользователя
+    """
+    __slots__ = ('policy_id', 'name', 'attribute', 'predicate')
+
+    def __init__(self, policy_id, name, attribute, predicate):
+        self.policy_id = policy_id
+        self.name = name
+        self.attribute = attribute
+        self.predicate = predicate
+
+    def matches(self, user):
+        return self.predicate(getattr(user, self.attribute, None))
+
+
+def validate_policy(attribute, operator_name, value):
+    """
+    Проверяет тройку (атрибут, оператор, значение), возвращает текст ошибки или None
+    """
+    if attribute not in USER_ATTRIBUTES:
+        return f'Неизвестный атрибут: {attribute}'
+    if operator_name not in OPERATORS:
+        return f'Неизвестный оператор: {operator_name}'
+    if not value:
+        return 'Не указано значение'
+    return None
+
+
+def compile_rule(policy):
+    prepare, compare = OPERATORS[policy.operator]
+    expected = prepare(policy.value)
+
+    def predicate(actual):
+        return compare(actual, expected)
+
+    return CompiledRule(policy.id, policy.name, policy.attribute, predicate)
+
+
+class PolicyEngine:
+    """
+    Неизменяемый набор скомпилированных правил, проиндексированный по resource_id
+    """
+
+    def __init__(self, rules_by_resource, version=0):
+        self._global = tuple(rules_by_resource.get(None, ()))
+        self._by_resource = {
+            resource_id: tuple(rules)
+            for resource_id, rules in rules_by_resource.items()
+            if resource_id is not None
+        }
+        self.version = version
+
+    @classmethod
+    def from_policies(cls, policies, version=0):
+        rules_by_resource = {}
+        for policy in policies:
+            # Битые строки в таблице не должны ронять всю проверку доступа,
+            # но пропущенное правило ослабляет защиту — об этом должно быть видно в логе
+            error = validate_policy(policy.attribute, policy.operator, policy.value)
+            if error:
+                logger.warning('policy_skipped', extra={'fields': {
+                    'policy_id': policy.id, 'name': policy.name, 'error': error,
+                }})
+                continue
+            rules_by_resource.setdefault(policy.resource_id, []).append(compile_rule(policy))
+        return cls(rules_by_resource, version)
+
+    def rules_for(self, resource_id):
+        return self._global + self._by_resource.get(resource_id, ())
+
+    def evaluate(self, user, resource_id):
+        for rule in self._global:
+            if not rule.matches(user):
+                return False, rule.name
+        for rule in self._by_resource.get(resource_id, ()):
+            if not rule.matches(user):
+                return False, rule.name
+        return True, None
+
+    def __len__(self):
+        return len(self._global) + sum(len(rules) for rules in self._by_resource.values())
+
+
+# Текущий движок; подменяется целиком одной операцией присваивания.
+# Версия движка — версия политик из БД, на которой он собран: её меняют только
+# записи в policy в любом процессе, поэтому воркеры замечают чужие изменения,
+# а запись ресурсов и содержимого пересборки не вызывает
+_engine = None
+_reload_lock = threading.Lock()
+# Когда последний раз сверялись с версией политик (time.monotonic).
+# Как часто сверяться — POLICY_VERSION_CHECK_INTERVAL в конфиге приложения
+_checked_at = 0.0
+
+
+def reload_policies():
+    """
+    Загружает все политики из БД и атомарно подменяет движок
+    """
+    global _engine, _checked_at
+    with _reload_lock:
+        # Сначала версия, потом правила: если между ними кто-то запишет,
+        # движок получит старую версию и пересоберётся при следующей сверке
+        version = policy_version()
+        _engine = PolicyEngine.from_policies(Policy.query.all(), version)
+        _checked_at = time.monotonic()
+    return _engine
+
+
+def get_engine():
+    global _checked_at
+    engine = _engine
+    if engine is None:
+        return reload_policies()
+    now = time.monotonic()
+    if now - _checked_at >= current_app.config['POLICY_VERSION_CHECK_INTERVAL']:
+        _checked_at = now
+        if policy_version() != engine.version:
+            engine = reload_policies()
+    return engine
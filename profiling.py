@@ -0,0 +1,111 @@
+import cProfile
+import os
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from telemetry import logger
+
+# Включается в init_profiling; пока выключено, phase() ничего не делает
+_enabled = False
+_noop = nullcontext()
+
+
+def phase(name):
+    """
+    Засекает время фазы запроса (auth, access, serialize) для Server-Timing
+    """
+    if not _enabled or not has_request_context() or 'phases' not in g:
+        return _noop
+    return _timed(name)
+
+
+@contextmanager
+def _timed(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.phases[name] = g.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_statements' in g:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started or not has_request_context() or 'sql_statements' not in g:
+        return
+    g.phases['db'] = g.phases.get('db', 0.0) + time.perf_counter() - started.pop()
+    g.sql_statements[statement] += 1
+
+
+def _server_timing(phases, query_count, total):
+    parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in phases.items()]
+    parts.append(f'queries;desc="{query_count}"')
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+def init_profiling(app, engines):
+    """
+    Включает учёт SQL-запросов, фазы в Server-Timing и выборочный cProfile.
+    При PROFILING_ENABLED=False не регистрирует ни одного обработчика
+    """
+    global _enabled
+    if not app.config['PROFILING_ENABLED']:
+        return
+    _enabled = True
+    profile_dir = app.config['PROFILING_DIR'] or os.path.join(app.instance_path, 'profiles')
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def wants_profile():
+        token = app.config['PROFILING_TOKEN']
+        if token and request.headers.get('X-Profile') == token:
+            return True
+        return random.random() < app.config['PROFILING_SAMPLE_RATE']
+
+    @app.before_request
+    def _start_profiling():
+        g.profiling_started = time.perf_counter()
+        g.phases = {}
+        g.sql_statements = Counter()
+        if wants_profile():
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish_profiling(response):
+        if 'profiling_started' not in g:
+            return response
+        total = time.perf_counter() - g.profiling_started
+        statements = g.sql_statements
+        query_count = sum(statements.values())
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{request.endpoint or "unknown"}.prof'
+            profiler.dump_stats(os.path.join(profile_dir, name))
+
+        # Один и тот же запрос много раз за обработку — вероятный N+1
+        repeated = [
+            (statement, count) for statement, count in statements.items()
+            if count >= app.config['PROFILING_NPLUS1_THRESHOLD']
+        ]
+        for statement, count in repeated:
+            logger.warning('n_plus_one', extra={'fields': {
+                'endpoint': request.endpoint, 'count': count, 'statement': statement[:200]
+            }})
+
+        response.headers['Server-Timing'] = _server_timing(g.phases, query_count, total)
+        response.headers['X-Query-Count'] = str(query_count)
+        return response
@@ -0,0 +1,31 @@
+import re
+from sqlalchemy import column, table, text
+from models import Resource
+
+resource_fts = table('resource_fts', column('rowid'))
+
+# Слово — буквы и цифры любого алфавита
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def match_expression(q):
+    """
+    Превращает пользовательский запрос в выражение MATCH: каждое слово
+    в кавычках (без синтаксиса FTS5) и с поиском по префиксу
+    """
+    tokens = _TOKEN_RE.findall(q or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_query(base_query, q):
+    """
+    Добавляет к запросу по Resource полнотекстовое условие и сортировку по bm25.
+    Совпадение в названии весит больше, чем в описании
+    """
+    return (
+        base_query
+        .join(resource_fts, resource_fts.c.rowid == Resource.id)
+        .filter(text('resource_fts MATCH :match'))
+        .order_by(text('bm25(resource_fts, 10.0, 1.0)'), Resource.id)
+        .params(match=match_expression(q))
+    )
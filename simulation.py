@@ -0,0 +1,194 @@
+from datetime import datetime
+from sqlalchemy import select
+from models import db, User, Resource, Policy
+from policy_engine import validate_policy
+from time_windows import minute_of_day
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy нужен только для симуляции
+    np = None
+
+
+class SimulationUnavailable(Exception):
+    """
+    Для симуляции нужен numpy
+    """
+
+
+def _rule(attribute, operator_name, value, resource_id):
+    if operator_name in ('in', 'not in'):
+        value = tuple(v.strip() for v in value.split(',') if v.strip())
+    return {'attribute': attribute, 'operator': operator_name, 'value': value, 'resource_id': resource_id}
+
+
+def current_rules():
+    return {
+        policy.id: _rule(policy.attribute, policy.operator, policy.value, policy.resource_id)
+        for policy in Policy.query.all()
+        if not validate_policy(policy.attribute, policy.operator, policy.value)
+    }
+
+
+def proposed_rules(rules, add=(), remove=()):
+    """
+    Новый набор правил: текущие без remove плюс add. Ошибки проверки — ValueError
+    """
+    remove = set(remove)
+    proposed = {policy_id: rule for policy_id, rule in rules.items() if policy_id not in remove}
+    for i, policy in enumerate(add):
+        value = policy.get('value')
+        value = str(value) if value is not None else None
+        error = validate_policy(policy.get('attribute'), policy.get('operator'), value)
+        if error:
+            raise ValueError(f'Правило {i}: {error}')
+        resource_id = policy.get('resource_id')
+        proposed[f'new-{i}'] = _rule(
+            policy['attribute'], policy['operator'], value,
+            int(resource_id) if resource_id is not None else None
+        )
+    return proposed
+
+
+def _rule_mask(rule, attributes):
+    values = attributes[rule['attribute']]
+    operator_name = rule['operator']
+    if operator_name == '==':
+        return values == rule['value']
+    if operator_name == '!=':
+        return values != rule['value']
+    mask = np.isin(values, rule['value'])
+    return mask if operator_name == 'in' else ~mask
+
+
+class CompiledRuleSet:
+    """
+    Правила в виде булевых масок над уникальными комбинациями атрибутов пользователей
+    """
+
+    def __init__(self, rules, attributes, combo_count):
+        self.global_mask = np.ones(combo_count, dtype=bool)
+        self.by_resource = {}
+        for rule in rules.values():
+            mask = _rule_mask(rule, attributes)
+            if rule['resource_id'] is None:
+                self.global_mask &= mask
+            elif rule['resource_id'] in self.by_resource:
+                self.by_resource[rule['resource_id']] &= mask
+            else:
+                self.by_resource[rule['resource_id']] = mask.copy()
+
+    def matrix(self, resource_ids):
+        # (ресурсы × комбинации): глобальные правила плюс правила конкретных ресурсов
+        result = np.broadcast_to(self.global_mask, (len(resource_ids), len(self.global_mask))).copy()
+        for row, resource_id in enumerate(resource_ids.tolist()):
+            mask = self.by_resource.get(resource_id)
+            if mask is not None:
+                result[row] &= mask
+        return result
+
+
+def _load_user_combos(chunk_size):
+    """
+    Читает атрибуты пользователей по частям в столбцовые массивы и
+    сворачивает их в уникальные комбинации с количеством пользователей
+    """
+    levels, statuses = [], []
+    result = db.session.execute(
+        select(User.subscription_level, User.account_status).execution_options(yield_per=chunk_size)
+    )
+    for chunk in result.partitions(chunk_size):
+        levels.append(np.array([row[0] or 'basic' for row in chunk], dtype=object))
+        statuses.append(np.array([row[1] or 'active' for row in chunk], dtype=object))
+    if not levels:
+        empty = np.array([], dtype=object)
+        return {'subscription_level': empty, 'account_status': empty}, np.array([], dtype=np.int64)
+
+    levels = np.concatenate(levels).astype(str)
+    statuses = np.concatenate(statuses).astype(str)
+    pairs = np.char.add(np.char.add(levels, '\x00'), statuses)
+    _, first_index, counts = np.unique(pairs, return_index=True, return_counts=True)
+    attributes = {
+        'subscription_level': levels[first_index],
+        'account_status': statuses[first_index],
+    }
+    return attributes, counts
+
+
+def _iter_resource_chunks(chunk_size):
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Resource.id, Resource.access_level, Resource.window_start, Resource.window_end)
+            .where(Resource.id > last_id).order_by(Resource.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield (
+            np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((row[1] == 'premium' for row in rows), dtype=bool, count=len(rows)),
+            np.fromiter((row[2] for row in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((row[3] for row in rows), dtype=np.int64, count=len(rows)),
+        )
+
+
+def simulate(add=(), remove=(), now=None, chunk_size=2048):
+    """
+    Сравнивает текущий и предлагаемый наборы политик на всей матрице
+    пользователи × ресурсы. Возвращает сводку по ресурсам и уровням подписки
+    """
+    if np is None:
+        raise SimulationUnavailable('Для симуляции установите numpy')
+
+    rules = current_rules()
+    proposed = proposed_rules(rules, add, remove)
+    minute = minute_of_day(now or datetime.now())
+
+    attributes, counts = _load_user_combos(chunk_size)
+    combo_count = len(counts)
+    current_set = CompiledRuleSet(rules, attributes, combo_count)
+    proposed_set = CompiledRuleSet(proposed, attributes, combo_count)
+
+    active = attributes['account_status'] == 'active'
+    premium_user = attributes['subscription_level'] == 'premium'
+    levels, level_index = np.unique(attributes['subscription_level'], return_inverse=True)
+
+    per_resource = []
+    denied_by_level = np.zeros(len(levels), dtype=np.int64)
+    allowed_by_level = np.zeros(len(levels), dtype=np.int64)
+    totals = {'newly_denied': 0, 'newly_allowed': 0, 'pairs': 0}
+
+    for ids, premium, start, end in _iter_resource_chunks(chunk_size):
+        # Встроенные правила check_access, векторно по всему блоку
+        open_now = np.where(start <= end, (start <= minute) & (minute <= end), (minute >= start) | (minute <= end))
+        base = active[None, :] & (~premium[:, None] | premium_user[None, :]) & open_now[:, None]
+
+        before = base & current_set.matrix(ids)
+        after = base & proposed_set.matrix(ids)
+        newly_denied = (before & ~after) * counts
+        newly_allowed = (~before & after) * counts
+
+        denied_per_resource = newly_denied.sum(axis=1)
+        allowed_per_resource = newly_allowed.sum(axis=1)
+        changed = np.nonzero(denied_per_resource | allowed_per_resource)[0]
+        per_resource.extend(
+            {'resource_id': int(ids[i]), 'newly_denied': int(denied_per_resource[i]),
+             'newly_allowed': int(allowed_per_resource[i])}
+            for i in changed
+        )
+        if combo_count:
+            denied_by_level += np.bincount(level_index, weights=newly_denied.sum(axis=0), minlength=len(levels)).astype(np.int64)
+            allowed_by_level += np.bincount(level_index, weights=newly_allowed.sum(axis=0), minlength=len(levels)).astype(np.int64)
+        totals['newly_denied'] += int(denied_per_resource.sum())
+        totals['newly_allowed'] += int(allowed_per_resource.sum())
+        totals['pairs'] += len(ids) * int(counts.sum())
+
+    return {
+        'totals': totals,
+        'per_subscription_level': {
+            str(level): {'newly_denied': int(denied_by_level[i]), 'newly_allowed': int(allowed_by_level[i])}
+            for i, level in enumerate(levels)
+        },
+        'per_resource': per_resource,
+    }
@@ -35,27 +35,56 @@ async function logout() {
     window.location.href = '/';
 }
 
-// Загрузка материалов
-async function loadResources() {
-    const res = await fetch('/api/resources');
-    const data = await res.json();
-    
-    const container = document.getElementById('resourcesList');
-    if (!data.resources || data.resources.length === 0) {
-        container.innerHTML = '<p>Нет доступных материалов</p>';
-        return;
-    }
-    
-    container.innerHTML = data.resources.map(r => `
+// Загрузка материалов: одна страница за раз, следующая — по кнопке (курсор next_cursor)
+function renderResource(r) {
+    return `
         <div class="resource-card">
             <h3>${r.name}</h3>
             <p>Уровень доступа: ${r.access_level}</p>
             <p>Время доступа: ${r.available_hours}</p>
             <a href="/resource/${r.id}">Подробнее</a>
         </div>
-    `).join('');
+    `;
+}
+
+async function loadResources(cursor = null) {
+    const container = document.getElementById('resourcesList');
+    const url = cursor === null ? '/api/resources' : `/api/resources?after=${cursor}`;
+    const res = await fetch(url);
+    const data = await res.json();
+    const resources = data.resources || [];
+    
+    document.getElementById('loadMoreBtn')?.remove();
+    if (cursor === null) {
+        container.innerHTML = resources.length > 0 ? '' : '<p>Нет доступных материалов</p>';
+    }
+    container.insertAdjacentHTML('beforeend', resources.map(renderResource).join(''));
+    
+    if (data.next_cursor !== null && data.next_cursor !== undefined) {
+        container.insertAdjacentHTML('beforeend', '<button id="loadMoreBtn" type="button">Загрузить ещё</button>');
+        document.getElementById('loadMoreBtn').addEventListener('click', () => loadResources(data.next_cursor));
+    }
 }
 
+// Поиск материалов
+document.getElementById('searchForm')?.addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const q = new FormData(e.target).get('q').trim();
+    if (!q) {
+        loadResources();
+        return;
+    }
+    
+    const res = await fetch(`/api/resources/search?q=${encodeURIComponent(q)}`);
+    const data = await res.json();
+    const container = document.getElementById('resourcesList');
+    if (!data.resources || data.resources.length === 0) {
+        container.innerHTML = '<p>Ничего не найдено</p>';
+        return;
+    }
+    container.innerHTML = data.resources.map(renderResource).join('');
+});
+
 // Инициализация
 if (window.location.pathname === '/resources') {
     loadResources();
@@ -0,0 +1,180 @@
+import atexit
+import bisect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request
+
+logger = logging.getLogger('abac')
+
+# Границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна JSON-строка на запись: время, уровень, событие и поля из extra={'fields': ...}
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю DEBUG-записей, остальные уровни — всегда
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        # Последняя корзина — всё, что больше верхней границы
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        # Оценка сверху: граница корзины, в которую попал q-й квантиль.
+        # Для корзины переполнения — наибольшее наблюдённое значение (inf не пишется в JSON)
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return round(self.max, 3)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 3) if self.count else None,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max, 3) if self.max is not None else None,
+        }
+
+
+class Metrics:
+    """
+    Счётчики запросов по маршрутам и решений о доступе по причинам
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._decisions = {}
+
+    def record_request(self, route, status, duration_ms):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {'statuses': {}, 'latency': Histogram()}
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+            stats['latency'].observe(duration_ms)
+
+    def record_decision(self, allowed, reason):
+        key = ('allow' if allowed else 'deny', reason)
+        with self._lock:
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            routes = {
+                route: {'statuses': dict(stats['statuses']), **stats['latency'].summary()}
+                for route, stats in self._routes.items()
+            }
+            decisions = {'allow': {}, 'deny': {}}
+            for (result, reason), count in self._decisions.items():
+                decisions[result][reason] = count
+        return {'routes': routes, 'decisions': decisions}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._decisions.clear()
+
+
+metrics = Metrics()
+
+
+def init_logging(app):
+    """
+    Логи пишутся в очередь, а в stdout их выводит отдельный поток,
+    поэтому обработчик запроса не ждёт ввода-вывода
+    """
+    if getattr(logger, '_listener', None) is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(app.config['LOG_SAMPLE_RATE']))
+    logger.addHandler(queue_handler)
+    logger.setLevel(app.config['LOG_LEVEL'])
+    logger.propagate = False
+
+    def start_listener(log_queue):
+        listener = QueueListener(log_queue, stream_handler)
+        listener.start()
+        logger._listener = listener
+        atexit.register(listener.stop)
+
+    def restart_in_child():
+        # После fork (gunicorn --preload) потока-слушателя в дочернем процессе нет
+        child_queue = queue.SimpleQueue()
+        queue_handler.queue = child_queue
+        start_listener(child_queue)
+
+    start_listener(log_queue)
+    os.register_at_fork(after_in_child=restart_in_child)
+
+
+def init_metrics(app):
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            # Шаблон маршрута, а не путь: /api/resources/<int:resource_id>
+            rule = request.url_rule.rule if request.url_rule else 'unmatched'
+            route = f'{request.method} {rule}'
+            metrics.record_request(route, response.status_code, (time.perf_counter() - started) * 1000)
+        return response
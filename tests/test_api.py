@@ -1,17 +1,33 @@
+import json
 import pytest
-from app import app, db
-from models import User
+from app import create_app
+from models import db, User, upgrade_schema
+from policy_engine import get_engine, reload_policies
+from auth import clear_user_cache
+from abac_logic import decision_cache
 
 @pytest.fixture
-def client():
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'AUDIT_DIR': str(tmp_path / 'audit'),
+        # Политики должны подхватываться сразу, без паузы между сверками
+        'POLICY_VERSION_CHECK_INTERVAL': 0,
+    })
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()
+        reload_policies()
+        clear_user_cache()
+        decision_cache.clear()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
     with app.test_client() as client:
-        with app.app_context():
-            db.create_all()
-            yield client
-        with app.app_context():
-            db.drop_all()
+        yield client
 
 def test_register(client):
     response = client.post('/api/register', json={
@@ -29,4 +45,848 @@ def test_login(client):
     response = client.post('/api/login', json={'username': 'test', 'password': 'test'})
     assert response.status_code == 200
     data = response.get_json()
-    assert data['success'] == True
\ No newline at end of file
+    assert data['success'] == True
+
+def login_as(client, username, subscription_level='basic'):
+    client.post('/api/register', json={
+        'username': username,
+        'password': 'test',
+        'subscription_level': subscription_level
+    })
+    client.post('/api/login', json={'username': username, 'password': 'test'})
+
+def test_policy_engine():
+    from types import SimpleNamespace
+    from policy_engine import PolicyEngine
+
+    policies = [
+        SimpleNamespace(id=1, name='Только активные', attribute='account_status', operator='==', value='active', resource_id=None),
+        SimpleNamespace(id=2, name='Премиум', attribute='subscription_level', operator='in', value='premium, gold', resource_id=7),
+        SimpleNamespace(id=3, name='Битое', attribute='password', operator='==', value='x', resource_id=None),
+    ]
+    engine = PolicyEngine.from_policies(policies)
+    basic = SimpleNamespace(subscription_level='basic', account_status='active')
+    gold = SimpleNamespace(subscription_level='gold', account_status='active')
+    frozen = SimpleNamespace(subscription_level='gold', account_status='frozen')
+
+    assert len(engine) == 2
+    assert engine.evaluate(basic, 1) == (True, None)
+    assert engine.evaluate(basic, 7) == (False, 'Премиум')
+    assert engine.evaluate(gold, 7) == (True, None)
+    assert engine.evaluate(frozen, 1) == (False, 'Только активные')
+
+def test_add_policy_applies_immediately(client):
+    login_as(client, 'admin', 'premium')
+    response = client.post('/api/resources', json={
+        'name': 'Курс', 'access_level': 'basic', 'available_hours': '00:00-23:59'
+    })
+    resource_id = response.get_json()['resource_id']
+
+    response = client.post('/api/policies', json={
+        'name': 'Только premium', 'attribute': 'subscription_level',
+        'operator': '==', 'value': 'premium', 'resource_id': resource_id
+    })
+    assert response.get_json()['success'] == True
+    assert client.get(f'/api/resources/{resource_id}').status_code == 200
+
+    login_as(client, 'student')
+    response = client.get(f'/api/resources/{resource_id}')
+    assert response.status_code == 403
+    assert 'Только premium' in response.get_json()['message']
+
+def test_add_policy_rejects_unknown_operator(client):
+    login_as(client, 'admin', 'premium')
+    response = client.post('/api/policies', json={
+        'name': 'Плохое', 'attribute': 'subscription_level', 'operator': '~=', 'value': 'x'
+    })
+    assert response.status_code == 400
+
+def test_time_windows():
+    from time_windows import parse_window, in_window
+
+    assert parse_window('09:00-18:00') == (540, 1080)
+    start, end = parse_window('22:00-02:00')
+    assert in_window(start, end, 23 * 60)
+    assert in_window(start, end, 60)
+    assert not in_window(start, end, 12 * 60)
+    with pytest.raises(ValueError):
+        parse_window('25:00-26:00')
+
+def test_add_resource_rejects_bad_hours(client):
+    login_as(client, 'admin', 'premium')
+    response = client.post('/api/resources', json={'name': 'Курс', 'available_hours': '9-18'})
+    assert response.status_code == 400
+    assert response.get_json()['success'] == False
+
+def test_resources_list_filters_in_sql(client):
+    from datetime import datetime
+    from abac_logic import access_filter
+    from models import Resource
+
+    login_as(client, 'admin', 'premium')
+    for name, level, hours in [
+        ('Всегда', 'basic', '00:00-23:59'),
+        ('Премиум', 'premium', '00:00-23:59'),
+        ('Ночной', 'basic', '22:00-02:00'),
+        ('Дневной', 'basic', '09:00-18:00'),
+    ]:
+        client.post('/api/resources', json={'name': name, 'access_level': level, 'available_hours': hours})
+
+    class Student:
+        subscription_level = 'basic'
+        account_status = 'active'
+
+    def visible(now):
+        return {r.name for r in Resource.query.filter(access_filter(Student, now)).all()}
+
+    assert visible(datetime(2024, 1, 1, 23, 30)) == {'Всегда', 'Ночной'}
+    assert visible(datetime(2024, 1, 1, 12, 0)) == {'Всегда', 'Дневной'}
+
+    Student.account_status = 'frozen'
+    assert visible(datetime(2024, 1, 1, 12, 0)) == set()
+
+    response = client.get('/api/resources')
+    names = {r['name'] for r in response.get_json()['resources']}
+    assert {'Всегда', 'Премиум'} <= names
+
+def test_resources_keyset_pagination(client):
+    login_as(client, 'admin', 'premium')
+    for i in range(5):
+        client.post('/api/resources', json={'name': f'Курс {i}', 'available_hours': '00:00-23:59'})
+
+    response = client.get('/api/resources?limit=2')
+    data = response.get_json()
+    assert [r['name'] for r in data['resources']] == ['Курс 0', 'Курс 1']
+
+    seen = [r['name'] for r in data['resources']]
+    while data['next_cursor'] is not None:
+        data = client.get(f"/api/resources?limit=2&after={data['next_cursor']}").get_json()
+        seen += [r['name'] for r in data['resources']]
+    assert seen == [f'Курс {i}' for i in range(5)]
+
+    response = client.get('/api/resources?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)['name'] for line in lines] == seen
+
+def test_decision_cache_lru_and_ttl():
+    from decision_cache import DecisionCache
+    from time_windows import seconds_until_boundary
+    from datetime import datetime
+
+    now = [0.0]
+    cache = DecisionCache(maxsize=2, max_ttl=100, clock=lambda: now[0])
+    cache.put(('basic', 'active', 'basic', 0, 1439, 1, 1), (True, 'ok'), ttl=10)
+    cache.put(('basic', 'active', 'basic', 0, 1439, 2, 1), (True, 'ok'))
+    assert cache.get(('basic', 'active', 'basic', 0, 1439, 1, 1)) == (True, 'ok')
+    cache.put(('basic', 'active', 'basic', 0, 1439, 3, 1), (False, 'no'))
+    assert cache.get(('basic', 'active', 'basic', 0, 1439, 2, 1)) is None
+    now[0] = 11
+    assert cache.get(('basic', 'active', 'basic', 0, 1439, 1, 1)) is None
+    cache.invalidate_resource(3)
+    assert len(cache) == 0
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['expirations'] == 1
+
+    assert seconds_until_boundary(540, 1080, datetime(2024, 1, 1, 17, 59, 30)) == 90
+    assert seconds_until_boundary(1320, 120, datetime(2024, 1, 1, 21, 0)) == 3600
+    assert seconds_until_boundary(0, 1439, datetime(2024, 1, 1, 12, 0)) is None
+
+def test_decision_cache_shared_between_users(client):
+    login_as(client, 'admin', 'premium')
+    resource_id = client.post('/api/resources', json={
+        'name': 'Курс', 'available_hours': '00:00-23:59'
+    }).get_json()['resource_id']
+
+    login_as(client, 'student1')
+    before = client.get('/api/cache/stats').get_json()
+    assert client.get(f'/api/resources/{resource_id}').status_code == 200
+    login_as(client, 'student2')
+    assert client.get(f'/api/resources/{resource_id}').status_code == 200
+    after = client.get('/api/cache/stats').get_json()
+    assert after['hits'] == before['hits'] + 1
+
+def test_user_loader_cache_invalidated_on_freeze(client):
+    from auth import CachedUser
+
+    login_as(client, 'admin', 'premium')
+    resource_id = client.post('/api/resources', json={
+        'name': 'Курс', 'available_hours': '00:00-23:59'
+    }).get_json()['resource_id']
+    assert client.get(f'/api/resources/{resource_id}').status_code == 200
+
+    user = User.query.filter_by(username='admin').first()
+    user.account_status = 'frozen'
+    db.session.commit()
+
+    response = client.get(f'/api/resources/{resource_id}')
+    assert response.status_code == 403
+    assert response.get_json()['message'] == 'Аккаунт не активен'
+    assert not hasattr(CachedUser('1', 'u', 'basic', 'active'), '__dict__')
+
+def test_login_rehashes_password_when_method_changes(client, app):
+    client.post('/api/register', json={'username': 'old', 'password': 'secret'})
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    try:
+        response = client.post('/api/login', json={'username': 'old', 'password': 'secret'})
+        assert response.get_json()['success'] == True
+        user = User.query.filter_by(username='old').first()
+        assert user.password.startswith('pbkdf2:sha256:1000$')
+    finally:
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:600000'
+
+def test_register_returns_503_when_hash_queue_full(client, monkeypatch):
+    import hashing
+
+    def busy(*args):
+        raise hashing.HashingBusy()
+
+    monkeypatch.setattr(hashing, '_run', busy)
+    response = client.post('/api/register', json={'username': 'u', 'password': 'p'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_metrics_endpoint(client):
+    from telemetry import Histogram
+
+    histogram = Histogram()
+    for value in [1] * 90 + [50] * 9 + [3000]:
+        histogram.observe(value)
+    assert histogram.summary()['p50_ms'] == 1
+    assert histogram.summary()['p95_ms'] == 50
+    assert histogram.summary()['p99_ms'] == 50
+    # Корзина переполнения: наибольшее значение, а не inf
+    histogram.observe(20000)
+    assert histogram.percentile(1.0) == 20000
+    assert json.loads(json.dumps(histogram.summary(), allow_nan=False))['max_ms'] == 20000
+
+    login_as(client, 'admin', 'premium')
+    resource_id = client.post('/api/resources', json={
+        'name': 'Курс', 'access_level': 'premium', 'available_hours': '00:00-23:59'
+    }).get_json()['resource_id']
+    login_as(client, 'student')
+    client.get(f'/api/resources/{resource_id}')
+    assert client.get('/api/metrics').status_code == 403
+
+    login_as(client, 'admin', 'premium')
+    data = client.get('/api/metrics').get_json()
+    route = data['routes']['GET /api/resources/<int:resource_id>']
+    assert route['count'] >= 1
+    assert route['p99_ms'] is not None
+    assert data['decisions']['deny']['subscription'] >= 1
+
+def test_bulk_import_resources_ndjson_and_csv(client):
+    login_as(client, 'admin', 'premium')
+    body = '\n'.join([
+        json.dumps({'name': 'Курс 1', 'available_hours': '00:00-23:59'}),
+        json.dumps({'name': 'Курс 2', 'available_hours': 'весь день'}),
+        'не json',
+        json.dumps({'name': 'Курс 3', 'access_level': 'premium', 'available_hours': '22:00-02:00'}),
+    ])
+    response = client.post('/api/bulk/resources', data=body, content_type='application/x-ndjson')
+    data = response.get_json()
+    assert data['inserted'] == 2
+    assert [e['row'] for e in data['errors']] == [2, 3]
+
+    from models import Resource
+    night = Resource.query.filter_by(name='Курс 3').first()
+    assert (night.window_start, night.window_end) == (22 * 60, 2 * 60)
+
+    body = 'name,access_level,available_hours\nCSV курс,basic,09:00-18:00\n,basic,09:00-18:00\n'
+    data = client.post('/api/bulk/resources', data=body, content_type='text/csv').get_json()
+    assert data['inserted'] == 1
+    assert data['errors'] == [{'row': 3, 'error': 'Не указано название'}]
+
+def test_bulk_import_users_and_policies(client):
+    login_as(client, 'admin', 'premium')
+    body = '\n'.join(json.dumps(row) for row in [
+        {'username': 'u1', 'password': 'p1'},
+        {'username': 'u1', 'password': 'p1'},
+        {'username': 'admin', 'password': 'p'},
+        {'username': 'u2'},
+    ])
+    data = client.post('/api/bulk/users', data=body, content_type='application/x-ndjson').get_json()
+    assert data['inserted'] == 1
+    assert data['failed'] == 3
+    assert client.post('/api/login', json={'username': 'u1', 'password': 'p1'}).get_json()['success']
+
+    login_as(client, 'admin', 'premium')
+    body = 'name,attribute,operator,value,resource_id\nТолько активные,account_status,==,active,\nПлохое,password,==,x,\n'
+    data = client.post('/api/bulk/policies', data=body, content_type='text/csv').get_json()
+    assert data['inserted'] == 1
+    assert data['errors'][0]['row'] == 3
+
+def test_access_batch(client, app):
+    login_as(client, 'admin', 'premium')
+    basic_id = client.post('/api/resources', json={
+        'name': 'Basic', 'available_hours': '00:00-23:59'
+    }).get_json()['resource_id']
+    premium_id = client.post('/api/resources', json={
+        'name': 'Premium', 'access_level': 'premium', 'available_hours': '00:00-23:59'
+    }).get_json()['resource_id']
+    client.post('/api/register', json={'username': 'student', 'password': 'test'})
+    client.post('/api/register', json={'username': 'frozen', 'password': 'test', 'account_status': 'frozen'})
+    admin, student, frozen = (User.query.filter_by(username=name).first().id for name in ('admin', 'student', 'frozen'))
+
+    body = {'pairs': [[admin, premium_id], [student, basic_id], [student, premium_id], [frozen, basic_id], [999, basic_id]]}
+    assert client.post('/api/access/batch', json=body).status_code == 401
+
+    app.config['ACCESS_API_TOKEN'] = 'secret'
+    try:
+        response = client.post('/api/access/batch', json=body, headers={'Authorization': 'Bearer secret'})
+        for bad in [[[admin, basic_id]], {'pairs': 'x'}, {'pairs': [[1]]}]:
+            assert client.post('/api/access/batch', json=bad, headers={'Authorization': 'Bearer secret'}).status_code == 400
+    finally:
+        app.config['ACCESS_API_TOKEN'] = ''
+    data = response.get_json()
+    assert data['allowed'] == [1, 1, 0, 0, 0]
+    assert data['reasons'] == ['allowed', 'allowed', 'subscription', 'account_inactive', 'user_not_found']
+
+def test_policy_simulation(client):
+    pytest.importorskip('numpy')
+    login_as(client, 'admin', 'premium')
+    basic_id = client.post('/api/resources', json={
+        'name': 'Basic', 'available_hours': '00:00-23:59'
+    }).get_json()['resource_id']
+    client.post('/api/resources', json={'name': 'Днём', 'available_hours': '09:00-18:00'})
+    for i in range(3):
+        client.post('/api/register', json={'username': f'student{i}', 'password': 'test'})
+    client.post('/api/register', json={'username': 'frozen', 'password': 'test', 'account_status': 'frozen'})
+
+    response = client.post('/api/policies/simulate', json={
+        'at': '20:00',
+        'add': [{'attribute': 'subscription_level', 'operator': '==', 'value': 'premium', 'resource_id': basic_id}]
+    })
+    data = response.get_json()
+    assert data['totals']['newly_denied'] == 3
+    assert data['totals']['newly_allowed'] == 0
+    assert data['per_resource'] == [{'resource_id': basic_id, 'newly_denied': 3, 'newly_allowed': 0}]
+    assert data['per_subscription_level']['basic'] == {'newly_denied': 3, 'newly_allowed': 0}
+
+    response = client.post('/api/policies/simulate', json={'add': [{'attribute': 'password', 'operator': '==', 'value': 'x'}]})
+    assert response.status_code == 400
+
+def test_search_resources(client):
+    login_as(client, 'admin', 'premium')
+    for name, description, level in [
+        ('Python Basics', 'Основы Python для начинающих', 'basic'),
+        ('Flask Advanced', 'Продвинутый Flask и Python', 'premium'),
+        ('SQL Database', 'Базы данных', 'basic'),
+    ]:
+        client.post('/api/resources', json={
+            'name': name, 'description': description, 'access_level': level, 'available_hours': '00:00-23:59'
+        })
+
+    names = [r['name'] for r in client.get('/api/resources/search?q=python').get_json()['resources']]
+    assert names == ['Python Basics', 'Flask Advanced']
+    names = [r['name'] for r in client.get('/api/resources/search?q=баз').get_json()['resources']]
+    assert names == ['SQL Database']
+
+    from models import Resource
+    resource = Resource.query.filter_by(name='SQL Database').first()
+    resource.name = 'PostgreSQL'
+    db.session.commit()
+    assert client.get('/api/resources/search?q=SQL').get_json()['resources'] == []
+    assert client.get('/api/resources/search?q="').status_code == 400
+
+    login_as(client, 'student')
+    names = [r['name'] for r in client.get('/api/resources/search?q=python').get_json()['resources']]
+    assert names == ['Python Basics']
+
+def test_resources_etag_and_compression(client):
+    import gzip
+    login_as(client, 'admin', 'premium')
+    for i in range(30):
+        client.post('/api/resources', json={'name': f'Курс {i}', 'description': 'Описание ' * 10, 'available_hours': '00:00-23:59'})
+
+    response = client.get('/api/resources')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'].startswith('private, max-age=')
+    assert client.get('/api/resources', headers={'If-None-Match': etag}).status_code == 304
+
+    compressed = client.get('/api/resources', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(compressed.get_data()))['resources'][0]['name'] == 'Курс 0'
+    assert client.get('/api/resources', headers={'If-None-Match': compressed.headers['ETag']}).status_code == 304
+
+    # NDJSON по Accept — другое представление, с другим ETag
+    assert 'Accept' in response.headers['Vary']
+    ndjson = client.get('/api/resources', headers={'Accept': 'application/x-ndjson', 'If-None-Match': etag})
+    assert ndjson.status_code == 200
+    assert ndjson.mimetype == 'application/x-ndjson'
+    assert json.loads(ndjson.get_data(as_text=True).splitlines()[0])['name'] == 'Курс 0'
+    assert ndjson.headers['ETag'] != etag
+
+    # Новый ресурс меняет версию каталога, а другой пользователь — класс атрибутов
+    client.post('/api/resources', json={'name': 'Ещё курс', 'available_hours': '00:00-23:59'})
+    assert client.get('/api/resources', headers={'If-None-Match': etag}).status_code == 200
+    login_as(client, 'student')
+    assert client.get('/api/resources', headers={'If-None-Match': etag}).status_code == 200
+
+def test_time_slot():
+    from datetime import datetime
+    from http_cache import time_slot
+
+    boundaries = (540, 1081)
+    assert time_slot(boundaries, datetime(2024, 1, 1, 8, 0)) == (0, 3600)
+    assert time_slot(boundaries, datetime(2024, 1, 1, 12, 0)) == (1, 6 * 3600 + 60)
+    assert time_slot(boundaries, datetime(2024, 1, 1, 23, 0))[0] == 0
+    assert time_slot((), datetime(2024, 1, 1, 12, 0)) == (0, None)
+
+def test_audit_log_segments(tmp_path):
+    from audit import AuditLog
+
+    audit_log = AuditLog(str(tmp_path), capacity=3, segment_bytes=200, max_segments=10)
+    for i in range(5):
+        audit_log.record(1, i, i % 2 == 0, 'ok')
+    assert audit_log.stats()['dropped'] == 2
+    audit_log.flush()
+    audit_log.record(2, 7, False, 'Нет доступа')
+    audit_log.flush()
+
+    assert len(audit_log.segments()) >= 2
+    records = [json.loads(line) for line in audit_log.iter_records()]
+    assert [r['resource_id'] for r in records] == [0, 1, 2, 7]
+    records = [json.loads(line) for line in audit_log.iter_records(allowed=False)]
+    assert [(r['user_id'], r['reason']) for r in records] == [(1, 'ok'), (2, 'Нет доступа')]
+
+def test_audit_endpoint(client, app, tmp_path, monkeypatch):
+    from audit import AuditLog
+
+    monkeypatch.setitem(app.extensions, 'audit', AuditLog(str(tmp_path)))
+    login_as(client, 'admin', 'premium')
+    resource_id = client.post('/api/resources', json={
+        'name': 'Premium', 'access_level': 'premium', 'available_hours': '00:00-23:59'
+    }).get_json()['resource_id']
+    login_as(client, 'student')
+    client.get(f'/api/resources/{resource_id}')
+
+    login_as(client, 'admin', 'premium')
+    response = client.get('/api/audit?allowed=0')
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(r['resource_id'], r['reason']) for r in records] == [(resource_id, 'Требуется premium подписка')]
+
+def test_create_app_has_no_db_side_effects(tmp_path):
+    from models import Resource, Policy
+
+    db_path = tmp_path / 'fresh.db'
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'AUDIT_DIR': str(tmp_path / 'audit')})
+    assert not db_path.exists()
+    assert app.extensions['startup_ms'] >= 0
+
+    result = app.test_cli_runner().invoke(args=['init-db'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert Resource.query.count() == 3
+        assert Policy.query.count() == 2
+
+def app_without_context(tmp_path, **config):
+    """
+    Приложение для тестов, где важно, чтобы у каждого запроса был свой g
+    (фикстура app держит контекст приложения открытым)
+    """
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "isolated.db"}',
+        'AUDIT_DIR': str(tmp_path / 'audit'),
+        'POLICY_VERSION_CHECK_INTERVAL': 0,
+        **config,
+    })
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()
+        reload_policies()
+        clear_user_cache()
+        decision_cache.clear()
+    return app
+
+def test_cache_settings_come_from_app_config(tmp_path):
+    from sqlalchemy import text
+
+    app = app_without_context(tmp_path, DECISION_CACHE_SIZE=5, DECISION_CACHE_MAX_TTL=60,
+                              POLICY_VERSION_CHECK_INTERVAL=3600)
+    assert (decision_cache.maxsize, decision_cache.max_ttl) == (5, 60)
+
+    with app.app_context():
+        engine = get_engine()
+        db.session.execute(text(
+            "INSERT INTO policy (name, attribute, operator, value) VALUES ('x', 'account_status', '==', 'active')"
+        ))
+        db.session.commit()
+        # До следующей сверки через час движок не пересобирается
+        assert get_engine() is engine
+
+def test_production_profile_routes_reads(tmp_path):
+    from sqlalchemy import event, text
+
+    app = app_without_context(tmp_path, DB_PROFILE='production')
+    read_engine = app.extensions['abac_read_engine']
+    with app.app_context():
+        primary = db.engine
+        with primary.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1
+    with read_engine.connect() as conn:
+        assert conn.execute(text('PRAGMA query_only')).scalar() == 1
+
+    # Какой движок выполнил каждый запрос
+    used = []
+    for name, engine in (('primary', primary), ('read', read_engine)):
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args, name=name: used.append((name, statement.split()[0])))
+
+    client = app.test_client()
+    login_as(client, 'admin', 'premium')
+    used.clear()
+    assert client.post('/api/resources', json={'name': 'Курс', 'available_hours': '00:00-23:59'}).status_code == 200
+    assert ('primary', 'INSERT') in used
+    assert all(name == 'primary' for name, _ in used)
+
+    used.clear()
+    assert [r['name'] for r in client.get('/api/resources').get_json()['resources']] == ['Курс']
+    assert used and all(name == 'read' for name, _ in used)
+
+def test_profiling_headers(tmp_path):
+    app = app_without_context(
+        tmp_path, PROFILING_ENABLED=True, PROFILING_TOKEN='secret', PROFILING_DIR=str(tmp_path / 'profiles')
+    )
+    client = app.test_client()
+    login_as(client, 'student')
+    response = client.get('/api/resources')
+    assert 'auth;dur=' in response.headers['Server-Timing']
+    assert int(response.headers['X-Query-Count']) > 0
+    assert not (tmp_path / 'profiles').exists()
+
+    client.get('/api/resources', headers={'X-Profile': 'secret'})
+    assert len(list((tmp_path / 'profiles').glob('*.prof'))) == 1
+
+def test_profiling_disabled_by_default(client):
+    login_as(client, 'student')
+    response = client.get('/api/resources')
+    assert 'Server-Timing' not in response.headers
+
+def test_token_buckets():
+    from admission import TokenBuckets
+
+    now = [0.0]
+    buckets = TokenBuckets(rate=1.0, burst=2, max_keys=10, sweep_interval=5, clock=lambda: now[0])
+    assert buckets.take('a') == 0
+    assert buckets.take('a') == 0
+    assert buckets.take('a') == pytest.approx(1.0)
+    now[0] = 1.0
+    assert buckets.take('a') == 0
+
+    # Через sweep_interval наполнившиеся корзины выметаются
+    now[0] = 10.0
+    buckets.take('b')
+    assert len(buckets) == 1
+
+    # При заполнении вытесняется давно не тронутая корзина, активная остаётся
+    for i in range(100):
+        buckets.take('b')
+        buckets.take(f'ip{i}')
+    assert len(buckets) == 10
+    assert 'b' in buckets._buckets and 'ip0' not in buckets._buckets
+
+def test_login_rate_limited_by_username(app, client):
+    app.extensions['admission'].by_username.burst = 2
+    client.post('/api/register', json={'username': 'victim', 'password': 'test'})
+    client.post('/api/login', json={'username': 'victim', 'password': 'wrong'})
+    response = client.post('/api/login', json={'username': 'Victim', 'password': 'wrong'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+    # Чтение не затронуто
+    assert client.get('/api/check').status_code == 200
+
+def test_token_mode(tmp_path):
+    import tokens
+    from models import Resource
+
+    tokens.reset()
+    app = app_without_context(tmp_path, AUTH_TOKEN_MODE=True)
+    client = app.test_client()
+    client.post('/api/register', json={'username': 'student', 'password': 'test'})
+    token = client.post('/api/login', json={'username': 'student', 'password': 'test'}).get_json()['token']
+    with app.app_context():
+        resource = Resource(name='Лекция', description='', access_level='basic', available_hours='00:00-23:59')
+        db.session.add(resource)
+        db.session.commit()
+        resource_id = resource.id
+
+    # Новый клиент без cookie: пользователь только из токена
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get(f'/api/resources/{resource_id}', headers=headers).status_code == 200
+    assert client.get('/api/check', headers={'Authorization': f'Bearer {token}x'}).get_json()['authenticated'] is False
+
+    # Смена атрибутов делает ранее выданный токен недействительным
+    with app.app_context():
+        User.query.filter_by(username='student').one().account_status = 'frozen'
+        db.session.commit()
+    assert client.get('/api/check', headers=headers).get_json()['authenticated'] is False
+
+def test_token_revoked_on_logout(tmp_path):
+    import tokens
+
+    tokens.reset()
+    app = app_without_context(tmp_path, AUTH_TOKEN_MODE=True)
+    client = app.test_client()
+    client.post('/api/register', json={'username': 'student', 'password': 'test'})
+    token = client.post('/api/login', json={'username': 'student', 'password': 'test'}).get_json()['token']
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/check', headers=headers).get_json()['authenticated'] is True
+    assert client.post('/api/logout', headers=headers).status_code == 200
+    assert client.get('/api/check', headers=headers).get_json()['authenticated'] is False
+
+def test_resource_content_ranges(app, client):
+    login_as(client, 'teacher', 'premium')
+    resource_id = client.post('/api/resources', json={'name': 'Лекция', 'available_hours': '00:00-23:59'}).get_json()['resource_id']
+    app.config['CONTENT_CHUNK_SIZE'] = 1000
+    body = bytes(range(256)) * 20
+    response = client.put(f'/api/resources/{resource_id}/content', data=body, content_type='application/pdf')
+    assert response.get_json()['size'] == len(body)
+
+    response = client.get(f'/api/resources/{resource_id}/content')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert response.data == body
+
+    # Диапазон через границу блоков
+    response = client.get(f'/api/resources/{resource_id}/content', headers={'Range': 'bytes=990-2010'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 990-2010/{len(body)}'
+    assert response.data == body[990:2011]
+
+    response = client.get(f'/api/resources/{resource_id}/content', headers={'Range': f'bytes={len(body)}-'})
+    assert response.status_code == 416
+
+    listed = client.get('/api/resources').get_json()['resources']
+    assert 'description' not in listed[0]
+    assert client.get(f'/api/resources/{resource_id}').get_json()['content_size'] == len(body)
+
+def test_long_description_stored_as_content(app, client):
+    from models import Resource, SchemaMigration
+
+    app.config['DESCRIPTION_SUMMARY_LENGTH'] = 20
+    app.config['CONTENT_CHUNK_SIZE'] = 100
+    text = 'Длинное описание курса. ' * 30
+    login_as(client, 'admin', 'premium')
+    resource_id = client.post('/api/resources', json={
+        'name': 'Курс', 'description': text, 'available_hours': '00:00-23:59'
+    }).get_json()['resource_id']
+    body = '\n'.join(json.dumps(row) for row in [
+        {'name': 'Короткий', 'description': 'Кратко', 'available_hours': '00:00-23:59'},
+        {'name': 'Импорт', 'description': text, 'available_hours': '00:00-23:59'},
+    ])
+    assert client.post('/api/bulk/resources', data=body, content_type='application/x-ndjson').get_json()['inserted'] == 2
+
+    for resource in Resource.query.filter(Resource.name != 'Короткий'):
+        assert len(resource.description) == 20 and resource.description.endswith('…')
+        response = client.get(f'/api/resources/{resource.id}/content')
+        assert response.mimetype == 'text/plain'
+        assert response.get_data(as_text=True) == text
+    short = client.get(f"/api/resources/{Resource.query.filter_by(name='Короткий').one().id}").get_json()
+    assert (short['description'], short['content_size']) == ('Кратко', None)
+
+    # Старая БД: длинное описание лежит в resource и переезжает при обновлении схемы
+    legacy = Resource(name='Старый', description=text, available_hours='00:00-23:59')
+    db.session.add(legacy)
+    SchemaMigration.query.filter_by(name='move_long_descriptions').delete()
+    db.session.commit()
+    upgrade_schema()
+    db.session.refresh(legacy)
+    assert legacy.description.endswith('…')
+    assert client.get(f'/api/resources/{legacy.id}/content').get_data(as_text=True) == text
+    assert client.get(f'/api/resources/{resource_id}').get_json()['content_size'] == len(text.encode('utf-8'))
+
+def test_fingerprinted_assets(tmp_path):
+    import gzip
+    import re
+
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'AUDIT_DIR': str(tmp_path / 'audit'),
+        'ASSETS_DIR': str(tmp_path / 'dist'),
+    })
+    client = app.test_client()
+    # Без сборки — исходные файлы
+    assert '/static/style.css' in client.get('/').get_data(as_text=True)
+
+    result = app.test_cli_runner().invoke(args=['build-assets'])
+    assert result.exit_code == 0, result.output
+    url = re.search(r'src="(/assets/script\.\w+\.js)"', client.get('/').get_data(as_text=True)).group(1)
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] in ('br', 'gzip')
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.mimetype in ('application/javascript', 'text/javascript')
+    import os
+    with open(os.path.join(app.static_folder, 'script.js'), 'rb') as f:
+        source = f.read()
+    if response.headers['Content-Encoding'] == 'gzip':
+        assert gzip.decompress(response.data) == source
+
+    response = client.get(url)
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == source
+
+def test_upgrade_rescopes_legacy_premium_policy(app, client):
+    from models import Resource, Policy, SchemaMigration
+
+    # БД из времён старого seed: миграция на ней ещё не выполнялась
+    SchemaMigration.query.delete()
+    db.session.add_all([
+        Resource(name='Python Basics', access_level='basic', available_hours='00:00-23:59'),
+        Resource(name='Flask Advanced', access_level='premium', available_hours='00:00-23:59'),
+    ])
+    # Так писал глобальное правило старый seed
+    db.session.add(Policy(name='Премиум доступ', attribute='subscription_level', operator='==', value='premium'))
+    db.session.commit()
+
+    upgrade_schema()
+    reload_policies()
+    premium = Resource.query.filter_by(access_level='premium').one()
+    assert Policy.query.filter_by(name='Премиум доступ').one().resource_id == premium.id
+
+    login_as(client, 'student')
+    names = [r['name'] for r in client.get('/api/resources').get_json()['resources']]
+    assert names == ['Python Basics']
+
+    # Миграция однократная: такое же глобальное правило, созданное позже, остаётся глобальным
+    db.session.add(Policy(name='Премиум доступ', attribute='subscription_level', operator='==', value='premium'))
+    db.session.commit()
+    upgrade_schema()
+    assert Policy.query.filter_by(name='Премиум доступ', resource_id=None).count() == 1
+
+def test_policy_written_by_another_process_is_picked_up(client):
+    from sqlalchemy import text
+
+    login_as(client, 'admin', 'premium')
+    resource_id = client.post('/api/resources', json={'name': 'Курс', 'available_hours': '00:00-23:59'}).get_json()['resource_id']
+    login_as(client, 'student')
+    assert client.get(f'/api/resources/{resource_id}').status_code == 200
+
+    # Запись в обход reload_policies, как из другого воркера
+    db.session.execute(text(
+        "INSERT INTO policy (name, attribute, operator, value, resource_id)"
+        " VALUES ('Закрыто', 'subscription_level', '==', 'gold', :id)"
+    ), {'id': resource_id})
+    db.session.commit()
+    assert client.get(f'/api/resources/{resource_id}').status_code == 403
+    assert client.get('/api/resources').get_json()['resources'] == []
+
+def test_decision_cache_keyed_on_resource_attributes(client):
+    from sqlalchemy import text
+
+    login_as(client, 'admin', 'premium')
+    resource_id = client.post('/api/resources', json={'name': 'Курс', 'available_hours': '00:00-23:59'}).get_json()['resource_id']
+    login_as(client, 'student')
+    assert client.get(f'/api/resources/{resource_id}').status_code == 200
+
+    # Другой воркер перевёл ресурс в premium: локальный кэш не сбрасывался,
+    # но уровень доступа входит в ключ, и старое решение не используется
+    db.session.execute(text("UPDATE resource SET access_level = 'premium' WHERE id = :id"), {'id': resource_id})
+    db.session.commit()
+    response = client.get(f'/api/resources/{resource_id}')
+    assert response.status_code == 403
+    assert response.get_json()['message'] == 'Требуется premium подписка'
+
+def test_unrelated_writes_keep_cached_decisions(client):
+    login_as(client, 'admin', 'premium')
+    resource_id = client.post('/api/resources', json={'name': 'Курс', 'available_hours': '00:00-23:59'}).get_json()['resource_id']
+    engine_version = get_engine().version
+    assert client.get(f'/api/resources/{resource_id}').status_code == 200
+    hits = decision_cache.stats()['hits']
+
+    # Запись других ресурсов не меняет ни версию политик, ни ключ решения
+    for i in range(3):
+        client.post('/api/resources', json={'name': f'Другой {i}'})
+        assert client.get(f'/api/resources/{resource_id}').status_code == 200
+    assert decision_cache.stats()['hits'] == hits + 3
+    assert get_engine().version == engine_version
+
+def test_content_upload_changes_detail_etag(client):
+    login_as(client, 'admin', 'premium')
+    resource_id = client.post('/api/resources', json={'name': 'Курс', 'available_hours': '00:00-23:59'}).get_json()['resource_id']
+    etag = client.get(f'/api/resources/{resource_id}').headers['ETag']
+
+    client.put(f'/api/resources/{resource_id}/content', data=b'x' * 50)
+    response = client.get(f'/api/resources/{resource_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['content_size'] == 50
+
+def test_hashing_timeout_is_busy(app, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import hashing
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(hashing, '_executor', executor)
+    monkeypatch.setattr(hashing, '_slots', threading.BoundedSemaphore(2))
+    app.config['HASH_TIMEOUT'] = 0.05
+    with pytest.raises(hashing.HashingBusy):
+        hashing._run(time.sleep, 0.3)
+    executor.shutdown()
+
+def test_hash_many_uses_slots(app, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import hashing
+
+    active = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def fake_hash(password, method, salt_length):
+        with lock:
+            active.append(password)
+            peak[0] = max(peak[0], len(active))
+        time.sleep(0.01)
+        with lock:
+            active.remove(password)
+        return f'hash:{password}'
+
+    slots = threading.BoundedSemaphore(3)
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(hashing, 'generate_password_hash', fake_hash)
+    monkeypatch.setattr(hashing, '_executor', executor)
+    monkeypatch.setattr(hashing, '_slots', slots)
+    monkeypatch.setattr(hashing, '_workers', 2)
+
+    passwords = [str(i) for i in range(10)]
+    assert hashing.hash_many(passwords) == [f'hash:{p}' for p in passwords]
+    assert peak[0] <= 2
+    executor.shutdown()
+    # Все слоты вернулись
+    assert all(slots.acquire(blocking=False) for _ in range(3))
+
+def test_bulk_import_rejects_bad_types_and_encoding(client):
+    login_as(client, 'admin', 'premium')
+    body = '\n'.join(json.dumps(row) for row in [
+        {'name': 'Курс 1', 'available_hours': '00:00-23:59'},
+        {'name': {'x': 1}},
+        {'name': 'Курс 2', 'description': ['a']},
+        {'name': 'Курс 3'},
+    ]).encode('utf-8') + b'\n{"name": "\xff\xfe"}\n'
+    data = client.post('/api/bulk/resources', data=body, content_type='application/x-ndjson').get_json()
+    assert data['inserted'] == 2
+    assert [e['row'] for e in data['errors']] == [2, 3, 5]
+    assert data['errors'][-1]['error'] == 'Некорректная кодировка, ожидается UTF-8'
+
+    body = 'name,access_level\nCSV курс,basic\n'.encode('utf-8') + b'\xff,basic\n'
+    data = client.post('/api/bulk/resources', data=body, content_type='text/csv').get_json()
+    assert data['inserted'] == 1
+    assert [e['row'] for e in data['errors']] == [3]
+
+def test_policy_simulation_rejects_malformed_body(client):
+    login_as(client, 'admin', 'premium')
+    for body in [{'add': 'abc'}, {'add': ['abc']}, {'remove': [True]}, {'remove': 'x'}, [1], {'at': 5}]:
+        response = client.post('/api/policies/simulate', json=body)
+        assert response.status_code == 400, body
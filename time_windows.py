@@ -0,0 +1,56 @@
+from datetime import datetime
+
+MINUTES_PER_DAY = 24 * 60
+FULL_DAY = (0, MINUTES_PER_DAY - 1)
+
+
+def parse_hhmm(value):
+    hours, minutes = value.strip().split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f'Некорректное время: {value}')
+    return hours * 60 + minutes
+
+
+def parse_window(available_hours):
+    """
+    Превращает строку вида '09:00-18:00' в пару минут от начала суток
+    """
+    try:
+        start_str, end_str = available_hours.split('-')
+        return parse_hhmm(start_str), parse_hhmm(end_str)
+    except (AttributeError, ValueError):
+        raise ValueError(f'Некорректное время доступа: {available_hours}')
+
+
+def format_minutes(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def minute_of_day(now=None):
+    now = now or datetime.now()
+    return now.hour * 60 + now.minute
+
+
+def in_window(start, end, minute):
+    # Окно через полночь, например 22:00-02:00
+    if start > end:
+        return minute >= start or minute <= end
+    return start <= minute <= end
+
+
+def seconds_until_boundary(start, end, now=None):
+    """
+    Сколько секунд осталось до ближайшего открытия или закрытия окна.
+    Для круглосуточного окна возвращает None
+    """
+    if (start, end) == FULL_DAY:
+        return None
+    now = now or datetime.now()
+    now_seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+    # Окно открывается в начале минуты start и закрывается после минуты end
+    boundaries = (start, (end + 1) % MINUTES_PER_DAY)
+    return min(
+        (boundary * 60 - now_seconds) % (MINUTES_PER_DAY * 60) or MINUTES_PER_DAY * 60
+        for boundary in boundaries
+    )
@@ -0,0 +1,83 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+
+# Версия пользователя в этом процессе: растёт при каждом изменении строки User.
+# Токен, выданный до изменения, больше не принимается
+_versions = {}
+# Отозванные токены: jti -> время истечения (после него запись не нужна)
+_revoked = {}
+_lock = threading.Lock()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(secret, body):
+    return hmac.new(secret.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+
+
+def bump_version(user_id):
+    with _lock:
+        _versions[user_id] = _versions.get(user_id, 0) + 1
+
+
+def revoke(payload):
+    now = time.time()
+    with _lock:
+        # Заодно выметаем истёкшие: их и так не примет проверка exp
+        for jti in [jti for jti, exp in _revoked.items() if exp <= now]:
+            del _revoked[jti]
+        _revoked[payload['jti']] = payload['exp']
+
+
+def reset():
+    with _lock:
+        _versions.clear()
+        _revoked.clear()
+
+
+def issue_token(user, secret, ttl):
+    """
+    Подписанный токен с id и ABAC-атрибутами пользователя:
+    base64(JSON).base64(HMAC-SHA256)
+    """
+    payload = {
+        'uid': user.id,
+        'name': user.username,
+        'sub': user.subscription_level,
+        'st': user.account_status,
+        'ver': _versions.get(user.id, 0),
+        'exp': int(time.time()) + ttl,
+        'jti': secrets.token_urlsafe(8),
+    }
+    body = _b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return f'{body}.{_b64encode(_sign(secret, body))}'
+
+
+def verify_token(token, secret):
+    """
+    Проверка без обращения к БД: подпись, срок, отзыв и версия пользователя.
+    Возвращает payload или None
+    """
+    body, _, signature = token.partition('.')
+    try:
+        if not hmac.compare_digest(_b64decode(signature), _sign(secret, body)):
+            return None
+        payload = json.loads(_b64decode(body))
+    except ValueError:
+        return None
+    if payload['exp'] <= time.time():
+        return None
+    if payload['jti'] in _revoked or payload['ver'] < _versions.get(payload['uid'], 0):
+        return None
+    return payload
@@ -0,0 +1,497 @@
+import hmac
+import json
+import logging
+from datetime import datetime
+from flask import Blueprint, Response, current_app, render_template, request, jsonify, stream_with_context
+from flask_login import login_required, current_user, logout_user
+from sqlalchemy.orm import defer
+from models import db, User, Resource, Policy, ResourceContent
+from auth import register_user, login_user_logic, issue_token, revoke_current_token
+from abac_logic import check_access, check_access_many, check_policies, access_filter, decision_cache
+from policy_engine import reload_policies, validate_policy
+from hashing import HashingBusy
+import bulk_import
+from search import match_expression, search_query
+from http_cache import conditional_get, wants_ndjson
+from telemetry import logger, metrics
+from profiling import phase
+from content import store_content, iter_content, split_description, insert_descriptions
+
+bp = Blueprint('main', __name__)
+
+# Пул хэширования паролей переполнен — отвечаем сразу, а не ждём
+@bp.app_errorhandler(HashingBusy)
+def hashing_busy(e):
+    response = jsonify({'success': False, 'message': 'Сервер перегружен, повторите попытку позже'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@bp.route('/')
+def index():
+    return render_template('index.html')
+
+@bp.route('/login')
+def login_page():
+    return render_template('login.html')
+
+@bp.route('/register')
+def register_page():
+    return render_template('register.html')
+
+@bp.route('/resources')
+@login_required
+def resources_page():
+    return render_template('resources.html')
+
+@bp.route('/resource/<int:resource_id>')
+@login_required
+def resource_detail_page(resource_id):
+    return render_template('resource_detail.html', resource_id=resource_id)
+
+@bp.route('/add-resource')
+@login_required
+def add_resource_page():
+    if current_user.subscription_level != 'premium':
+        return "Только premium пользователи могут добавлять материалы", 403
+    return render_template('add_resource.html')
+
+# API ЭНДПОИНТЫ
+
+# Регистрация
+@bp.route('/api/register', methods=['POST'])
+def api_register():
+    data = request.json
+    username = data.get('username')
+    password = data.get('password')
+    subscription_level = data.get('subscription_level', 'basic')
+    account_status = data.get('account_status', 'active')
+    
+    success, message = register_user(username, password, subscription_level, account_status)
+    return jsonify({'success': success, 'message': message})
+
+# Вход
+@bp.route('/api/login', methods=['POST'])
+def api_login():
+    data = request.json
+    username = data.get('username')
+    password = data.get('password')
+    
+    success, message = login_user_logic(username, password)
+    if success and current_app.config['AUTH_TOKEN_MODE']:
+        return jsonify({
+            'success': success, 'message': message,
+            'token': issue_token(current_user), 'expires_in': current_app.config['AUTH_TOKEN_TTL']
+        })
+    return jsonify({'success': success, 'message': message})
+
+# Проверка авторизации
+@bp.route('/api/check', methods=['GET'])
+def api_check():
+    if current_user.is_authenticated:
+        return jsonify({
+            'authenticated': True,
+            'username': current_user.username,
+            'subscription_level': current_user.subscription_level
+        })
+    return jsonify({'authenticated': False})
+
+# Выход
+@bp.route('/api/logout', methods=['POST'])
+@login_required
+def api_logout():
+    revoke_current_token()
+    logout_user()
+    return jsonify({'success': True, 'message': 'Вы вышли'})
+
+# Добавление ресурса
+@bp.route('/api/resources', methods=['POST'])
+@login_required
+def api_add_resource():
+    if current_user.subscription_level != 'premium':
+        return jsonify({'success': False, 'message': 'Требуется premium подписка'}), 403
+    
+    data = request.json
+    # В строку ресурса — только сводка, длинный текст — сжатым содержимым материала
+    summary, body = split_description(data.get('description', ''), current_app.config['DESCRIPTION_SUMMARY_LENGTH'])
+    try:
+        new_resource = Resource(
+            name=data.get('name'),
+            description=summary,
+            access_level=data.get('access_level', 'basic'),
+            available_hours=data.get('available_hours', '09:00-18:00')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    db.session.add(new_resource)
+    db.session.flush()
+    if body is not None:
+        insert_descriptions(db.session, {new_resource.id: body}, current_app.config['CONTENT_CHUNK_SIZE'])
+    db.session.commit()
+    decision_cache.invalidate_resource(new_resource.id)
+    return jsonify({'success': True, 'resource_id': new_resource.id})
+
+# Для списков: только короткие поля, описание в выборку не попадает
+def resource_summary(resource):
+    return {
+        'id': resource.id,
+        'name': resource.name,
+        'access_level': resource.access_level,
+        'available_hours': resource.available_hours
+    }
+
+def resource_to_dict(resource):
+    content = db.session.get(ResourceContent, resource.id)
+    return {
+        **resource_summary(resource),
+        'description': resource.description,
+        'content_size': content.size if content else None
+    }
+
+# Запись решения в журнал аудита (в буфер, на диск его пишет фоновый поток)
+def audit_decision(user_id, resource_id, allowed, reason):
+    if current_app.config['AUDIT_ENABLED']:
+        current_app.extensions['audit'].record(user_id, resource_id, allowed, reason)
+
+# Доступные ресурсы по возрастанию id, начиная после курсора.
+# Строки читаются порциями с серверного курсора, а не списком целиком
+def iter_accessible_resources(user, now, after=None, batch_size=500):
+    query = Resource.query.options(defer(Resource.description)).filter(access_filter(user, now))
+    if after is not None:
+        query = query.filter(Resource.id > after)
+    query = query.order_by(Resource.id).yield_per(batch_size)
+    # Проверяем уровень один раз, чтобы не собирать поля для выключенного DEBUG
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    for resource in query:
+        with phase('access'):
+            allowed, message = check_policies(user, resource)
+        audit_decision(user.id, resource.id, allowed, message)
+        if debug:
+            logger.debug('resource_checked', extra={'fields': {
+                'user_id': user.id, 'resource_id': resource.id, 'allowed': allowed, 'reason': message
+            }})
+        
+        if allowed:
+            yield resource
+
+# Получение всех ресурсов (постранично, курсор по id)
+@bp.route('/api/resources', methods=['GET'])
+@login_required
+@conditional_get
+def api_get_resources():
+    # Время считаем один раз на весь запрос
+    now = datetime.now()
+    
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', current_app.config['RESOURCES_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['RESOURCES_MAX_PAGE_SIZE']))
+    
+    # NDJSON: по строке на ресурс, без ограничения страницы и без накопления в памяти
+    if wants_ndjson():
+        user = current_user._get_current_object()
+        
+        def generate():
+            for resource in iter_accessible_resources(user, now, after, limit):
+                yield json.dumps(resource_summary(resource), ensure_ascii=False) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    # Берём на один ресурс больше, чтобы понять, есть ли следующая страница
+    accessible_resources = []
+    for resource in iter_accessible_resources(current_user, now, after, limit + 1):
+        accessible_resources.append(resource_summary(resource))
+        if len(accessible_resources) > limit:
+            break
+    
+    next_cursor = None
+    if len(accessible_resources) > limit:
+        accessible_resources = accessible_resources[:limit]
+        next_cursor = accessible_resources[-1]['id']
+    
+    logger.debug('resources_listed', extra={'fields': {
+        'user_id': current_user.id, 'count': len(accessible_resources), 'after': after
+    }})
+    with phase('serialize'):
+        return jsonify({'resources': accessible_resources, 'next_cursor': next_cursor})
+
+# Полнотекстовый поиск по доступным ресурсам (FTS5, ранжирование bm25)
+@bp.route('/api/resources/search', methods=['GET'])
+@login_required
+def api_search_resources():
+    q = request.args.get('q', '')
+    if not match_expression(q):
+        return jsonify({'success': False, 'message': 'Пустой запрос'}), 400
+    
+    limit = request.args.get('limit', current_app.config['RESOURCES_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['RESOURCES_MAX_PAGE_SIZE']))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    
+    query = search_query(
+        Resource.query.options(defer(Resource.description)).filter(access_filter(current_user, datetime.now())), q
+    )
+    rows = query.offset(offset).limit(limit + 1).all()
+    next_offset = offset + limit if len(rows) > limit else None
+    
+    results = []
+    for resource in rows[:limit]:
+        allowed, _ = check_policies(current_user, resource)
+        if allowed:
+            results.append(resource_summary(resource))
+    return jsonify({'resources': results, 'next_offset': next_offset})
+
+# Получение конкретного ресурса
+@bp.route('/api/resources/<int:resource_id>', methods=['GET'])
+@login_required
+@conditional_get
+def api_get_resource(resource_id):
+    resource = Resource.query.get(resource_id)
+    if not resource:
+        return jsonify({'success': False, 'message': 'Ресурс не найден'}), 404
+    
+    with phase('access'):
+        allowed, message = check_access(current_user, resource, request.remote_addr)
+    audit_decision(current_user.id, resource_id, allowed, message)
+    logger.debug('resource_requested', extra={'fields': {
+        'user_id': current_user.id, 'resource_id': resource_id, 'allowed': allowed, 'reason': message
+    }})
+    
+    if not allowed:
+        return jsonify({'success': False, 'message': message}), 403
+    
+    with phase('serialize'):
+        return jsonify({'success': True, **resource_to_dict(resource)})
+
+# Загрузка содержимого материала (сырое тело запроса, для premium)
+@bp.route('/api/resources/<int:resource_id>/content', methods=['PUT'])
+@login_required
+def api_put_resource_content(resource_id):
+    if current_user.subscription_level != 'premium':
+        return jsonify({'success': False, 'message': 'Требуется premium подписка'}), 403
+    if db.session.get(Resource, resource_id) is None:
+        return jsonify({'success': False, 'message': 'Ресурс не найден'}), 404
+    
+    content = store_content(
+        resource_id, request.stream, request.mimetype, current_app.config['CONTENT_CHUNK_SIZE']
+    )
+    return jsonify({'success': True, 'size': content.size})
+
+# Скачивание содержимого потоком, с поддержкой Range (один диапазон)
+@bp.route('/api/resources/<int:resource_id>/content', methods=['GET'])
+@login_required
+def api_get_resource_content(resource_id):
+    resource = db.session.get(Resource, resource_id, options=[defer(Resource.description)])
+    content = db.session.get(ResourceContent, resource_id)
+    if resource is None or content is None:
+        return jsonify({'success': False, 'message': 'Содержимое не найдено'}), 404
+    
+    allowed, message = check_access(current_user, resource, request.remote_addr)
+    audit_decision(current_user.id, resource_id, allowed, message)
+    if not allowed:
+        return jsonify({'success': False, 'message': message}), 403
+    
+    start, stop, status = 0, content.size, 200
+    byte_range = request.range
+    # If-Range с другим ETag — содержимое поменялось, отдаём целиком
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and len(byte_range.ranges) == 1 and (if_range is None or if_range.strip('"') == content.digest):
+        bounds = byte_range.range_for_length(content.size)
+        if bounds is None:
+            response = jsonify({'success': False, 'message': 'Диапазон вне содержимого'})
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{content.size}'
+            return response
+        (start, stop), status = bounds, 206
+    
+    response = Response(
+        stream_with_context(iter_content(content, start, stop)), status=status, mimetype=content.mimetype
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Length'] = str(stop - start)
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{content.size}'
+    response.set_etag(content.digest)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Добавление политики (для админов)
+@bp.route('/api/policies', methods=['POST'])
+@login_required
+def api_add_policy():
+    if current_user.subscription_level != 'premium':
+        return jsonify({'success': False, 'message': 'Требуется premium'}), 403
+    
+    data = request.json
+    error = validate_policy(data.get('attribute'), data.get('operator'), data.get('value'))
+    if error or not data.get('name'):
+        return jsonify({'success': False, 'message': error or 'Не указано название'}), 400
+    
+    new_policy = Policy(
+        name=data.get('name'),
+        attribute=data.get('attribute'),
+        operator=data.get('operator'),
+        value=str(data.get('value')),
+        resource_id=data.get('resource_id')
+    )
+    db.session.add(new_policy)
+    db.session.commit()
+    # Пересобираем движок политик, чтобы правило заработало сразу
+    reload_policies()
+    decision_cache.clear()
+    return jsonify({'success': True, 'policy_id': new_policy.id})
+
+# Что будет, если применить политики: сколько пар пользователь-ресурс потеряют или получат доступ
+@bp.route('/api/policies/simulate', methods=['POST'])
+@login_required
+def api_simulate_policies():
+    if current_user.subscription_level != 'premium':
+        return jsonify({'success': False, 'message': 'Требуется premium'}), 403
+    
+    # numpy нужен только здесь, поэтому импортируем при первом вызове
+    import simulation
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'Ожидается JSON-объект'}), 400
+    add, remove = data.get('add', []), data.get('remove', [])
+    if not isinstance(add, list) or not all(isinstance(policy, dict) for policy in add):
+        return jsonify({'success': False, 'message': 'add — список правил-объектов'}), 400
+    if not isinstance(remove, list) or not all(
+            isinstance(policy_id, int) and not isinstance(policy_id, bool) for policy_id in remove):
+        return jsonify({'success': False, 'message': 'remove — список id политик'}), 400
+    
+    now = datetime.now()
+    if data.get('at'):
+        try:
+            now = datetime.combine(now.date(), datetime.strptime(data['at'], '%H:%M').time())
+        except (ValueError, TypeError):
+            return jsonify({'success': False, 'message': 'Время в формате ЧЧ:ММ'}), 400
+    try:
+        result = simulation.simulate(
+            add=add,
+            remove=remove,
+            now=now,
+            chunk_size=current_app.config['SIMULATION_CHUNK_SIZE']
+        )
+    except simulation.SimulationUnavailable as e:
+        return jsonify({'success': False, 'message': str(e)}), 501
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, **result})
+
+# Массовая загрузка (NDJSON или CSV в теле запроса, для админов)
+def run_bulk_import(import_rows):
+    if current_user.subscription_level != 'premium':
+        return jsonify({'success': False, 'message': 'Требуется premium'}), 403
+    
+    rows = bulk_import.iter_rows(request.stream, request.mimetype)
+    report = import_rows(rows, current_app.config['BULK_BATCH_SIZE'])
+    return jsonify({'success': report['failed'] == 0, **report})
+
+@bp.route('/api/bulk/resources', methods=['POST'])
+@login_required
+def api_bulk_resources():
+    return run_bulk_import(bulk_import.import_resources)
+
+@bp.route('/api/bulk/users', methods=['POST'])
+@login_required
+def api_bulk_users():
+    return run_bulk_import(bulk_import.import_users)
+
+@bp.route('/api/bulk/policies', methods=['POST'])
+@login_required
+def api_bulk_policies():
+    response = run_bulk_import(bulk_import.import_policies)
+    reload_policies()
+    decision_cache.clear()
+    return response
+
+# Пакетная проверка доступа для других сервисов (по сервисному токену, без сессии)
+def has_service_token():
+    token = current_app.config['ACCESS_API_TOKEN']
+    header = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+
+# Загрузка строк по списку id: один IN-запрос на каждую тысячу id (лимит переменных SQLite)
+def load_rows_by_id(columns, ids, chunk_size=900):
+    ids = list(ids)
+    rows = {}
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        for row in db.session.query(*columns).filter(columns[0].in_(chunk)):
+            rows[row.id] = row
+    return rows
+
+@bp.route('/api/access/batch', methods=['POST'])
+def api_access_batch():
+    if not has_service_token():
+        return jsonify({'success': False, 'message': 'Нужен сервисный токен'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'Ожидается JSON-объект'}), 400
+    pairs = data.get('pairs')
+    if not isinstance(pairs, list):
+        return jsonify({'success': False, 'message': 'Ожидается список pairs'}), 400
+    if len(pairs) > current_app.config['ACCESS_BATCH_MAX_PAIRS']:
+        return jsonify({'success': False, 'message': f"Не больше {current_app.config['ACCESS_BATCH_MAX_PAIRS']} пар"}), 413
+    try:
+        pairs = [(int(user_id), int(resource_id)) for user_id, resource_id in pairs]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Пара должна быть [user_id, resource_id]'}), 400
+    
+    # Только нужные атрибуты, без ORM-объектов
+    users = load_rows_by_id(
+        (User.id, User.subscription_level, User.account_status),
+        {user_id for user_id, _ in pairs}
+    )
+    resources = load_rows_by_id(
+        (Resource.id, Resource.access_level, Resource.window_start, Resource.window_end),
+        {resource_id for _, resource_id in pairs}
+    )
+    decisions = check_access_many(pairs, users, resources)
+    for (user_id, resource_id), (allowed, reason) in zip(pairs, decisions):
+        audit_decision(user_id, resource_id, allowed, reason)
+    # Компактный ответ: два массива в порядке пар запроса
+    return jsonify({
+        'allowed': [int(allowed) for allowed, _ in decisions],
+        'reasons': [reason for _, reason in decisions]
+    })
+
+# Статистика кэша решений о доступе
+@bp.route('/api/cache/stats', methods=['GET'])
+@login_required
+def api_cache_stats():
+    return jsonify(decision_cache.stats())
+
+# Метрики: запросы и задержки по маршрутам, решения о доступе по причинам
+@bp.route('/api/metrics', methods=['GET'])
+@login_required
+def api_metrics():
+    if current_user.subscription_level != 'premium':
+        return jsonify({'success': False, 'message': 'Требуется premium'}), 403
+    
+    return jsonify({
+        **metrics.snapshot(),
+        'decision_cache': decision_cache.stats(),
+        'audit': current_app.extensions['audit'].stats(),
+        'admission': current_app.extensions['admission'].stats() if 'admission' in current_app.extensions else None
+    })
+
+# Чтение журнала аудита потоком NDJSON (для админов)
+@bp.route('/api/audit', methods=['GET'])
+@login_required
+def api_audit():
+    if current_user.subscription_level != 'premium':
+        return jsonify({'success': False, 'message': 'Требуется premium'}), 403
+    
+    audit_log = current_app.extensions['audit']
+    # Чтобы в выдачу попали последние решения из буфера
+    audit_log.flush()
+    allowed = request.args.get('allowed')
+    records = audit_log.iter_records(
+        user_id=request.args.get('user_id', type=int),
+        resource_id=request.args.get('resource_id', type=int),
+        allowed=None if allowed is None else allowed in ('1', 'true'),
+        since=request.args.get('since', type=float)
+    )
+    return Response(records, mimetype='application/x-ndjson')